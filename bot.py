@@ -1,48 +1,346 @@
 import os
 import asyncio
+import platform
+import random
 import re
 import shutil
-import json
+import signal
 import logging
-import tempfile
+import threading
 import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
 from datetime import datetime
 from aiohttp import web
 
+import orjson
+import psutil
+from cachetools import TTLCache
+
 from pyrogram import Client, filters, idle
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import RPCError, FloodWait
 
 import yt_dlp
-import ffmpeg
+
+# Optional: refresh cookies metadata when the file changes on disk
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
 
 # Configure logging
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv('LOG_LEVEL', 'WARNING').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# Keep framework chatter out of the logs even when LOG_LEVEL is lowered
+logging.getLogger('pyrogram').setLevel(logging.WARNING)
+
+# yt-dlp error classification, one pass over the message
+_YTDL_ERROR_RE = re.compile(
+    r'(?P<unavailable>video unavailable|private video)'
+    r'|(?P<auth>sign in|age verification)',
+    re.IGNORECASE
+)
+
+# Cookie names that mark a logged-in YouTube session in cookies.txt
+_YT_COOKIE_NAME_RE = re.compile(
+    r'LOGIN_INFO|SID|HSID|SSID|APISID|SAPISID|YSC|VISITOR_INFO1_LIVE'
+)
+
+# Accepted YouTube URL shapes as one precompiled alternation
+_YT_URL_RE = re.compile(
+    r'(?:https?://)?(?:'
+    r'(?:www\.)?youtube\.com/(?:'
+    r'watch\?(?:.*&)?v=[\w-]+'
+    r'|watch\?[\w=&%-]+v=[\w-]+'
+    r'|shorts/[\w-]+'
+    r'|playlist\?list=[\w-]+'
+    r'|embed/[\w-]+)'
+    r'|m\.youtube\.com/watch\?v=[\w-]+'
+    r'|youtu\.be/[\w-]+)',
+    re.IGNORECASE
+)
+
+# Video ID in watch/short/embed URLs, used as the info cache key
+_YT_VIDEO_ID_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/)([\w-]{11})')
+
+# sanitize_filename; [^\w\s-] also covers the characters invalid in paths
+_FILENAME_STRIP_RE = re.compile(r'[^\w\s-]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Containers yt-dlp may leave behind when it can't produce an MP4
+_VIDEO_EXTS = frozenset({'.mp4', '.mkv', '.webm', '.flv', '.avi'})
+
+# Static landing page served at /
+_ROOT_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>YouTube Downloader Telegram Bot</title>
+    <style>
+        body { font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; line-height: 1.6; }
+        .container { background: #f5f5f5; padding: 30px; border-radius: 10px; margin-top: 20px; }
+        .status { padding: 15px; border-radius: 5px; margin: 10px 0; }
+        .status-ok { background: #d4edda; color: #155724; }
+        .status-error { background: #f8d7da; color: #721c24; }
+        .endpoints { background: #fff; padding: 20px; border-radius: 5px; margin-top: 20px; }
+        code { background: #eee; padding: 2px 5px; border-radius: 3px; }
+    </style>
+</head>
+<body>
+    <h1>🎬 YouTube Downloader Telegram Bot</h1>
+    <p>This is a Telegram bot that downloads YouTube videos and sends them to users.</p>
+    
+    <div class="container">
+        <h2>📊 Bot Status</h2>
+        <div class="status" id="status">Loading status...</div>
+        
+        <h2>🔗 Endpoints</h2>
+        <div class="endpoints">
+            <p><strong>Health Check:</strong> <code><a href="/health">/health</a></code></p>
+            <p><strong>Status:</strong> <code><a href="/status">/status</a></code></p>
+            <p><strong>Home:</strong> <code><a href="/">/</a></code></p>
+        </div>
+        
+        <h2>📱 How to Use</h2>
+        <p>1. Find the bot on Telegram: <code>@YourBotUsername</code></p>
+        <p>2. Send <code>/start</code> to begin</p>
+        <p>3. Use <code>/yt</code> to download videos</p>
+    </div>
+    
+    <script>
+        async function updateStatus() {
+            try {
+                const response = await fetch('/health');
+                const data = await response.json();
+                document.getElementById('status').innerHTML = 
+                    `<div class="status-ok">✅ Bot is running (Active downloads: ${data.active_downloads})</div>`;
+            } catch (error) {
+                document.getElementById('status').innerHTML = 
+                    `<div class="status-error">❌ Error: ${error.message}</div>`;
+            }
+        }
+        
+        updateStatus();
+        setInterval(updateStatus, 30000);
+    </script>
+</body>
+</html>
+"""
+_ROOT_HTML_BYTES = _ROOT_HTML.encode('utf-8')
+
+# /health body; only the counters and timestamp change between requests
+_HEALTH_TEMPLATE = (
+    b'{"status":"ok","service":"youtube-downloader-bot","cookies_available":%s,'
+    b'"active_downloads":%d,"user_states":%d,"timestamp":"%s"}'
+)
+
+_ADMIN_COMMANDS_TEXT = (
+    "\n\n**👑 Admin Commands:**\n"
+    "• /cookies_info - View detailed cookies info\n"
+    "• /cookies_upload - Upload new cookies file (in private chat)\n"
+    "• /getcookies - Download current cookies file (in private chat)\n"
+    "• /cookies_backup - Backup current cookies\n"
+    "• /cookies_test - Test cookies with YouTube\n"
+    "• /cookies_delete - Delete cookies file\n"
+    "• /cookies_refresh - Refresh cookies status\n"
+)
+
+_START_TEMPLATE = (
+    "🎬 **YouTube Video Downloader Bot**\n\n"
+    "**📋 Commands:**\n"
+    "• /yt - Download a YouTube video\n"
+    "• /batch - Download multiple videos from text file\n"
+    "• /status - Check bot status\n"
+    "• /cookies_status - Check cookies status\n"
+    "• /stop - Cancel current download\n"
+    "• /help - Show this message"
+    "{admin_commands}"
+    "\n\n**⚙️ Limits:**\n"
+    "• Max duration: {max_min} minutes\n"
+    "• Supported resolutions: 144p, 240p, 360p, 480p, 720p, 1080p\n"
+    "• Format: MP4/MKV\n\n"
+    "**🍪 Cookies Status:** {cookies_status}\n"
+    "• Age-restricted videos require cookies\n\n"
+    "**📖 Usage:**\n"
+    "1. Send /yt\n"
+    "2. Reply with a YouTube URL\n"
+    "3. Select resolution (default: 720p)"
+)
+
+_STATUS_TEMPLATE = (
+    "🤖 **Bot Status**\n\n"
+    "**System:** {system}\n"
+    "**CPU Usage:** {cpu_percent}%\n"
+    "**Memory:** {memory_percent}% used\n"
+    "**Disk:** {disk_percent}% used\n"
+    "**Active Downloads:** {active_downloads}\n"
+    "**Cookies:** {cookies}\n"
+    "**Temp Directory:** {temp_dir}\n"
+    "**Web Server:** ✅ Running on port {port}\n\n"
+    "✅ Bot is running normally"
+)
+
+_COOKIES_STATUS_TEMPLATE = (
+    "🍪 **Cookies Status**\n\n"
+    "✅ **Status:** Active and working\n"
+    "📁 **Location:** `{path}`\n"
+    "📏 **Size:** {size} bytes\n"
+    "📅 **Last Modified:** {modified}\n"
+    "🔄 **Format:** {format}\n"
+    "📊 **Lines:** {line_count}\n"
+    "🌐 **Domains:** {domain_count}\n\n"
+    "✅ **Age-restricted videos:** Supported"
+)
+
+_COOKIES_MISSING_TEXT = (
+    "🍪 **Cookies Status**\n\n"
+    "❌ **Status:** Not configured or invalid\n\n"
+    "**Without cookies:**\n"
+    "• Age-restricted videos will fail\n"
+    "• Some videos may require sign-in\n"
+    "• YouTube may block some requests\n\n"
+    "**To fix:**\n"
+    "Contact an admin to upload cookies."
+)
+
+
+@dataclass(frozen=True, slots=True)
+class BotConfig:
+    """Settings loaded from the environment at startup"""
+    api_id: int
+    api_hash: str
+    bot_token: str
+    cookies_path: str
+    cookies_backup_dir: str
+    max_duration: int
+    max_file_size: int
+    allowed_users: frozenset
+    admin_users: frozenset
+    max_concurrent: int
+    max_global_downloads: int
+    temp_dir: str
+    port: int
+    proxy_url: str
+    max_retries: int
+    fragment_retries: int
+    concurrent_fragments: int
+    ffmpeg_threads: int
+    max_state_entries: int
+    state_ttl: int
+    cache_video_info: bool
+    yt_dlp_timeout: int
+    max_concurrent_transmissions: int
+
+
+@dataclass(slots=True)
+class UserState:
+    """Where a user is in a /yt or /batch conversation"""
+    state: str
+    message_id: Optional[int] = None
+    resolution: str = "720"
+    urls: Optional[List[str]] = None
+
+
+@dataclass(frozen=True, slots=True)
+class CookiesMeta:
+    """Snapshot of the cookies file, rebuilt only when the file changes"""
+    path: str = ''
+    size: int = 0
+    modified: str = 'Unknown'
+    format: str = 'Unknown'
+    line_count: int = 0
+    domain_count: int = 0
+    available: bool = False
+
+
+class CookiesFileHandler(FileSystemEventHandler):
+    """Re-scan the cookies file whenever it changes, off the bot's loop"""
+    
+    def __init__(self, bot: 'YouTubeDownloaderBot', loop: asyncio.AbstractEventLoop):
+        self.bot = bot
+        self.loop = loop
+        self.path = os.path.abspath(bot.config.cookies_path)
+    
+    def on_any_event(self, event):
+        paths = (event.src_path, getattr(event, 'dest_path', ''))
+        if self.path in (os.path.abspath(p) for p in paths if p):
+            asyncio.run_coroutine_threadsafe(self.bot.refresh_cookies_file(), self.loop)
+
+
+def _json_response(data: Any, status: int = 200) -> web.Response:
+    """JSON response serialized with orjson instead of the stdlib json module"""
+    return web.Response(body=orjson.dumps(data), status=status, content_type='application/json')
 
 
 class YouTubeDownloaderBot:
     def __init__(self):
         self.config = self.load_config()
         self.app = None
-        self.user_states = {}  # Stores user states for URL input
-        self.active_downloads = {}  # Tracks active downloads
-        self.cookies_available = False
-        self.cookies_metadata = {}
+        max_states = self.config.max_state_entries
+        # Abandoned conversations expire instead of lingering forever
+        self.user_states = TTLCache(maxsize=max_states, ttl=self.config.state_ttl)  # Stores user states for URL input
+        self.active_downloads = {}  # Task ID -> user ID of active downloads
+        self._next_task_id = 0  # Last task ID handed out
+        self.cookies_meta = CookiesMeta()
+        self._cookies_cache_key = None  # (mtime_ns, size) the metadata was built from
+        self.allowed_ids = self.config.allowed_users
         self.admin_ids = self.get_admin_ids()
         self.runner = None
-        self.cookie_upload_states = {}  # Track cookie upload states
+        self._web_loop = None  # Event loop of the web server thread
+        self._web_thread = None
+        self._cookies_observer = None  # watchdog observer for the cookies file, if available
+        self.cookie_upload_states = TTLCache(maxsize=max_states, ttl=self.config.state_ttl)  # Track cookie upload states
         self.download_states = {}  # Track download states for each user
+        self._active_per_user = defaultdict(int)  # User ID -> requests running or queued
+        self._stop_event = None  # Set by SIGINT/SIGTERM to stop run()
+        # Split the CPUs between concurrent downloads instead of letting every
+        # ffmpeg start one thread per core
+        self._ffmpeg_threads = str(
+            self.config.ffmpeg_threads
+            or max(1, (os.cpu_count() or 2) // max(1, self.config.max_global_downloads))
+        )
+        self._download_sem = asyncio.Semaphore(self.config.max_global_downloads)  # Bounds running downloads bot-wide
+        self._sys_metrics_cache = (0.0, None)  # (monotonic timestamp, metrics)
+        self._user_states_count = 0  # len(user_states) published for the web server thread
+        self._now_iso = (0.0, '')  # (monotonic timestamp, ISO string) for web responses
+        self._info_cache = TTLCache(maxsize=1024, ttl=3600)  # Video ID -> title/duration
+        self._probe_cache = {}  # Video path -> ffprobe task, cleared with the download's temp dir
+        self._inflight = {}  # (video ID, resolution) -> future resolved when that download finishes
+        self._sent_videos = TTLCache(maxsize=1024, ttl=3600)  # (video ID, resolution) -> (chat_id, message_id)
+        self._cleanup_queue = None  # Download temp dirs for cleanup_worker, created in run()
+        self._last_edit = {}  # (chat_id, message_id) -> (monotonic time, text) of the last status edit
+        self._flood_until = 0.0  # monotonic time before which no send is attempted
+        self._ydl_probe = None  # Shared YoutubeDL for cookies tests, built lazily
+        self._ydl_probe_lock = threading.Lock()
+        self._ydl_local = threading.local()  # Per-thread YoutubeDL for extract_video_info
+        self._ydl_generation = 0  # Bumped when the cookies change to rebuild YoutubeDL instances
+        
+        # yt-dlp options for info extraction, with and without cookies
+        self._info_opts = {
+            'quiet': True,
+            'no_warnings': False,
+            'extract_flat': False,
+            'skip_download': True,
+            'force_generic_extractor': False,
+        }
+        if self.config.proxy_url:
+            self._info_opts['proxy'] = self.config.proxy_url
+        self._info_opts_cookies = {**self._info_opts, 'cookiefile': self.config.cookies_path}
         
         # Initialize cookies
         self.check_cookies_file()
         
-    def load_config(self) -> Dict[str, Any]:
+    def load_config(self) -> 'BotConfig':
         """Load configuration from environment variables"""
         config = {
             'api_id': int(os.getenv('TELEGRAM_API_ID', 0)),
@@ -52,14 +350,22 @@ class YouTubeDownloaderBot:
             'cookies_backup_dir': os.getenv('COOKIES_BACKUP_DIR', '/tmp/cookies_backup'),
             'max_duration': int(os.getenv('MAX_DURATION', '1800')),
             'max_file_size': int(os.getenv('MAX_FILE_SIZE', '1500000000')),
-            'allowed_users': os.getenv('ALLOWED_USERS', '').split(',') if os.getenv('ALLOWED_USERS') else [],
-            'admin_users': os.getenv('ADMIN_USERS', '').split(',') if os.getenv('ADMIN_USERS') else [],
+            'allowed_users': self.parse_user_ids(os.getenv('ALLOWED_USERS', '')),
+            'admin_users': self.parse_user_ids(os.getenv('ADMIN_USERS', '')),
             'max_concurrent': int(os.getenv('MAX_CONCURRENT_DOWNLOADS', '1')),
+            'max_global_downloads': int(os.getenv('MAX_GLOBAL_DOWNLOADS', '3')),
             'temp_dir': os.getenv('TEMP_DIR', '/tmp/ytdl'),
             'port': int(os.getenv('PORT', '10000')),
             'proxy_url': os.getenv('PROXY_URL', ''),
             'max_retries': int(os.getenv('MAX_RETRIES', '3')),
             'fragment_retries': int(os.getenv('FRAGMENT_RETRIES', '25')),
+            'concurrent_fragments': int(os.getenv('YTDL_CONCURRENT_FRAGS', '8')),
+            'ffmpeg_threads': int(os.getenv('FFMPEG_THREADS_PER_INVOCATION', '0')),
+            'max_state_entries': int(os.getenv('MAX_STATE_ENTRIES', '10000')),
+            'state_ttl': int(os.getenv('STATE_TTL', '600')),
+            'cache_video_info': os.getenv('CACHE_VIDEO_INFO', 'true').lower() in ('1', 'true', 'yes'),
+            'yt_dlp_timeout': int(os.getenv('YT_DLP_TIMEOUT', '60')),
+            'max_concurrent_transmissions': int(os.getenv('MAX_CONCURRENT_TRANSMISSIONS', '4')),
         }
         
         # Create directories
@@ -74,126 +380,163 @@ class YouTubeDownloaderBot:
         logger.info(f"Web server will run on port: {config['port']}")
         if config['proxy_url']:
             logger.info(f"Proxy configured: {config['proxy_url']}")
-        return config
+        return BotConfig(**config)
     
-    def get_admin_ids(self) -> List[str]:
-        """Get list of admin user IDs"""
-        admin_ids = []
-        
-        # Add users from ADMIN_USERS
-        if self.config.get('admin_users'):
-            admin_ids.extend([uid.strip() for uid in self.config['admin_users'] if uid.strip()])
-        
+    def parse_user_ids(self, raw: str) -> frozenset:
+        """Parse a comma-separated list of Telegram user IDs"""
+        user_ids = set()
+        for uid in raw.split(','):
+            uid = uid.strip()
+            if not uid:
+                continue
+            try:
+                user_ids.add(int(uid))
+            except ValueError:
+                logger.warning(f"Ignoring invalid user ID: {uid}")
+        return frozenset(user_ids)
+    
+    def get_admin_ids(self) -> frozenset:
+        """Get set of admin user IDs"""
         # If no admin users specified, use allowed_users as admin
-        if not admin_ids and self.config.get('allowed_users'):
-            admin_ids.extend([uid.strip() for uid in self.config['allowed_users'] if uid.strip()])
-        
-        return admin_ids
+        return self.config.admin_users or self.config.allowed_users
+    
+    @property
+    def cookies_available(self) -> bool:
+        return self.cookies_meta.available
     
     def check_cookies_file(self):
         """Check cookies file and load metadata"""
-        cookies_path = self.config['cookies_path']
+        result = self.read_cookies_meta(self._cookies_cache_key)
+        if result is not None:
+            self.apply_cookies_meta(*result)
+    
+    async def refresh_cookies_file(self):
+        """Check cookies file after a change on disk, reading it in a worker thread"""
+        result = await asyncio.to_thread(self.read_cookies_meta, self._cookies_cache_key)
+        if result is not None:
+            self.apply_cookies_meta(*result)
+    
+    def apply_cookies_meta(self, cache_key: Optional[Tuple[int, int]], meta: CookiesMeta):
+        """Install freshly read cookies metadata; runs on the event loop"""
+        if cache_key != self._cookies_cache_key:
+            # The file changed, appeared or went away; YoutubeDL instances
+            # built from the old cookies are rebuilt on next use
+            self.reset_probe_ydl()
+        self._cookies_cache_key = cache_key
+        self.cookies_meta = meta
+    
+    def read_cookies_meta(self, known_key: Optional[Tuple[int, int]]
+                          ) -> Optional[Tuple[Optional[Tuple[int, int]], CookiesMeta]]:
+        """Stat and scan the cookies file
         
-        if os.path.exists(cookies_path):
-            try:
-                cookies_size = os.path.getsize(cookies_path)
-                mod_time = os.path.getmtime(cookies_path)
-                mod_date = datetime.fromtimestamp(mod_time).strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Read first few lines to check format
-                with open(cookies_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    first_line = content.split('\n')[0].strip() if content else ""
-                    
-                self.cookies_available = cookies_size > 100
-                
-                # Load metadata
-                self.cookies_metadata = {
-                    'path': cookies_path,
-                    'size': cookies_size,
-                    'modified': mod_date,
-                    'format': 'Netscape' if first_line.startswith('# Netscape') else 'Unknown',
-                    'line_count': self.count_lines(cookies_path),
-                    'domain_count': self.count_domains(cookies_path),
-                }
-                
-                if self.cookies_available:
-                    logger.info(f"Cookies file found: {cookies_path} ({cookies_size} bytes, modified: {mod_date})")
-                else:
-                    logger.warning(f"Cookies file is too small or empty: {cookies_path}")
-                    
-            except Exception as e:
-                logger.error(f"Error reading cookies file: {e}")
-                self.cookies_available = False
-                self.cookies_metadata = {}
-        else:
+        Returns the (mtime_ns, size) key and metadata, or None when the file
+        still matches known_key. Touches no bot state, so it can run in a
+        worker thread.
+        """
+        cookies_path = self.config.cookies_path
+        
+        try:
+            st = os.stat(cookies_path)
+        except FileNotFoundError:
             logger.warning(f"No cookies file found at: {cookies_path}")
-            self.cookies_available = False
-            self.cookies_metadata = {}
-    
-    def count_lines(self, filepath: str) -> int:
-        """Count lines in a file"""
+            return None, CookiesMeta()
+        except OSError as e:
+            logger.error(f"Error reading cookies file: {e}")
+            return None, CookiesMeta()
+        
+        # Skip re-parsing when the file hasn't changed since the last scan
+        cache_key = (st.st_mtime_ns, st.st_size)
+        if cache_key == known_key:
+            return None
+        
         try:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                return sum(1 for _ in f)
-        except:
-            return 0
+            cookies_size = st.st_size
+            mod_time = st.st_mtime
+            mod_date = datetime.fromtimestamp(mod_time).strftime('%Y-%m-%d %H:%M:%S')
+            
+            # Read the file once for format, line and domain counts
+            scan = self.scan_cookies_file(cookies_path)
+            
+            meta = CookiesMeta(
+                path=cookies_path,
+                size=cookies_size,
+                modified=mod_date,
+                format='Netscape' if scan['first_line'].startswith(b'# Netscape') else 'Unknown',
+                line_count=scan['line_count'],
+                domain_count=scan['domain_count'],
+                available=cookies_size > 100,
+            )
+            
+            if meta.available:
+                logger.info("Cookies file found: %s (%d bytes, modified: %s)", cookies_path, cookies_size, mod_date)
+            else:
+                logger.warning("Cookies file is too small or empty: %s", cookies_path)
+            return cache_key, meta
+            
+        except Exception as e:
+            logger.error(f"Error reading cookies file: {e}")
+            return None, CookiesMeta()
     
-    def count_domains(self, filepath: str) -> int:
-        """Count unique domains in cookies file"""
-        domains = set()
+    def scan_cookies_file(self, filepath: str) -> Dict[str, Any]:
+        """Read a cookies file once and return its first line, line count and domain count"""
+        result = {'first_line': b'', 'line_count': 0, 'domain_count': 0}
         try:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                for line in f:
-                    if line.strip() and not line.startswith('#'):
-                        parts = line.strip().split('\t')
-                        if len(parts) >= 5:
-                            domains.add(parts[0])
-            return len(domains)
-        except:
-            return 0
+            with open(filepath, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return result
+        
+        lines = data.split(b'\n')
+        if lines and not lines[-1]:
+            lines.pop()  # Trailing newline doesn't start a new line
+        
+        domains = set()
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith(b'#') and line.count(b'\t') >= 4:
+                domains.add(line.split(b'\t', 1)[0])
+        
+        result['first_line'] = lines[0].strip() if lines else b''
+        result['line_count'] = len(lines)
+        result['domain_count'] = len(domains)
+        return result
     
-    def validate_cookies_file(self, filepath: str) -> Tuple[bool, str]:
-        """Validate if file is a valid cookies.txt file"""
+    def validate_cookies_data(self, data: bytes, file_size: Optional[int] = None) -> Tuple[bool, str]:
+        """Validate cookies.txt content held in memory"""
         try:
-            if not os.path.exists(filepath):
-                return False, "File does not exist"
-            
-            file_size = os.path.getsize(filepath)
+            if file_size is None:
+                file_size = len(data)
             if file_size < 100:
                 return False, f"File too small ({file_size} bytes). Minimum 100 bytes required."
             
             if file_size > 1024 * 1024:  # 1MB
                 return False, f"File too large ({file_size} bytes). Maximum 1MB allowed."
             
-            # Check if it looks like a cookies.txt file
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                first_line = content.split('\n')[0].strip()
+            text = data.decode('utf-8', errors='ignore')
             
-            # Check for Netscape format header
-            is_netscape = first_line.startswith('# Netscape HTTP Cookie File')
+            # Check for YouTube-specific and important YouTube cookies
+            # with one scan of the whole text each
+            has_youtube_cookies = 'youtube.com' in text or '.youtu.be' in text
+            has_important_cookies = _YT_COOKIE_NAME_RE.search(text) is not None
             
-            # Check for YouTube-specific cookies
-            youtube_domains = ['.youtube.com', 'youtube.com', '.youtu.be']
-            has_youtube_cookies = any(domain in content for domain in youtube_domains)
+            # Check if it looks like a cookies.txt file
+            first_line = None
+            cookie_lines = 0
+            for line in text.splitlines():
+                if first_line is None:
+                    first_line = line.strip()
+                
+                # Count cookie lines
+                line = line.strip()
+                if line and not line.startswith('#') and line.count('\t') >= 6:
+                    cookie_lines += 1
             
-            # Check for important YouTube cookies
-            important_cookies = ['LOGIN_INFO', 'SID', 'HSID', 'SSID', 'APISID', 'SAPISID', 'YSC', 'VISITOR_INFO1_LIVE']
-            has_important_cookies = any(cookie in content for cookie in important_cookies)
+            # Check for Netscape format header
+            is_netscape = (first_line or '').startswith('# Netscape HTTP Cookie File')
             
             if not has_youtube_cookies:
                 return False, "No YouTube cookies found in file"
             
-            # Count cookie lines
-            cookie_lines = 0
-            for line in content.split('\n'):
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    parts = line.split('\t')
-                    if len(parts) >= 7:
-                        cookie_lines += 1
-            
             if cookie_lines == 0 and not is_netscape:
                 return False, "File doesn't appear to be a valid cookies.txt format"
             
@@ -211,145 +554,190 @@ class YouTubeDownloaderBot:
             return False, f"Error validating file: {str(e)}"
     
     def backup_current_cookies(self):
-        """Backup current cookies file"""
-        if os.path.exists(self.config['cookies_path']):
+        """Backup current cookies file
+        
+        The backup is always a copy, never a hardlink: the cookies file can
+        be edited in place outside the bot, so a link to the live inode would
+        not stay a snapshot.
+        """
+        if os.path.exists(self.config.cookies_path):
             try:
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                backup_path = os.path.join(self.config['cookies_backup_dir'], f'cookies_backup_{timestamp}.txt')
-                shutil.copy2(self.config['cookies_path'], backup_path)
+                backup_path = os.path.join(self.config.cookies_backup_dir, f'cookies_backup_{timestamp}.txt')
+                shutil.copy2(self.config.cookies_path, backup_path)
                 logger.info(f"Backed up cookies to: {backup_path}")
                 return backup_path
             except Exception as e:
                 logger.error(f"Failed to backup cookies: {e}")
         return None
     
+    def get_probe_ydl(self) -> yt_dlp.YoutubeDL:
+        """Get the shared YoutubeDL instance used for cookies tests
+        
+        Building a YoutubeDL loads cookies and sets up the HTTP stack, so one
+        instance is kept until the cookies file changes. Callers must hold
+        _ydl_probe_lock while using it.
+        """
+        if self._ydl_probe is None:
+            ydl_opts = {
+                'quiet': True,
+                'no_warnings': True,
+                'extract_flat': True,
+                'cookiefile': self.config.cookies_path,
+                'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'http_headers': {
+                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                    'Accept-Language': 'en-US,en;q=0.5',
+                    'Accept-Encoding': 'gzip, deflate',
+                    'DNT': '1',
+                    'Connection': 'keep-alive',
+                    'Upgrade-Insecure-Requests': '1',
+                }
+            }
+            
+            # Add proxy if configured
+            if self.config.proxy_url:
+                ydl_opts['proxy'] = self.config.proxy_url
+            
+            self._ydl_probe = yt_dlp.YoutubeDL(ydl_opts)
+        return self._ydl_probe
+    
+    def reset_probe_ydl(self):
+        """Drop the shared YoutubeDL instances so the next use picks up new cookies
+        
+        The old instances are not closed: YoutubeDL.close() saves its cookie
+        jar back to the cookies file, which would overwrite a new upload or
+        recreate a deleted file. The reference is swapped without taking
+        _ydl_probe_lock so a probe still running in a worker thread can't
+        block the event loop; that probe keeps its own reference.
+        """
+        self._ydl_generation += 1
+        self._ydl_probe = None
+    
     async def start_web_server(self):
-        """Start a simple HTTP server for Render health checks"""
-        app = web.Application()
+        """Start a simple HTTP server for Render health checks
+        
+        The server runs on its own thread and event loop, so health checks
+        keep answering even while the bot's loop is busy. Its handlers only
+        read plain counters and immutable snapshots from the bot; user_states
+        is a TTLCache whose len() expires entries, so the bot loop publishes
+        its size in _user_states_count instead.
+        """
+        self._web_loop = asyncio.new_event_loop()
+        self._web_thread = threading.Thread(target=self._web_loop.run_forever, name='web-server', daemon=True)
+        self._web_thread.start()
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(self.setup_web_server(), self._web_loop)
+        )
+    
+    async def setup_web_server(self):
+        """Build and start the aiohttp app; runs on the web server loop"""
+        # Only small GET requests are served, so cap request bodies tightly
+        app = web.Application(client_max_size=1024)
         
         # Health check endpoint
         async def health_check(request):
-            return web.json_response({
-                'status': 'ok',
-                'service': 'youtube-downloader-bot',
-                'cookies_available': self.cookies_available,
-                'active_downloads': len(self.active_downloads),
-                'user_states': len(self.user_states),
-                'timestamp': datetime.now().isoformat()
-            })
+            body = _HEALTH_TEMPLATE % (
+                b'true' if self.cookies_available else b'false',
+                len(self.active_downloads),
+                self._user_states_count,
+                self.now_iso().encode()
+            )
+            return web.Response(body=body, content_type='application/json')
         
         # Status endpoint
         async def status(request):
             try:
-                import psutil
-                import platform
+                cpu_percent, memory_percent, disk_percent = await self.get_system_metrics()
                 
                 status_info = {
                     'status': 'running',
                     'bot': 'Telegram YouTube Downloader',
                     'system': f"{platform.system()} {platform.release()}",
-                    'cpu_percent': psutil.cpu_percent(),
-                    'memory_percent': psutil.virtual_memory().percent,
-                    'disk_percent': psutil.disk_usage('/').percent,
+                    'cpu_percent': cpu_percent,
+                    'memory_percent': memory_percent,
+                    'disk_percent': disk_percent,
                     'active_downloads': len(self.active_downloads),
-                    'user_states': len(self.user_states),
+                    'user_states': self._user_states_count,
                     'cookies_available': self.cookies_available,
-                    'cookies_size': self.cookies_metadata.get('size', 0),
-                    'temp_dir': self.config['temp_dir'],
-                    'timestamp': datetime.now().isoformat()
+                    'cookies_size': self.cookies_meta.size,
+                    'temp_dir': self.config.temp_dir,
+                    'timestamp': self.now_iso()
                 }
-                return web.json_response(status_info)
+                return _json_response(status_info)
             except Exception as e:
-                return web.json_response({'status': 'error', 'message': str(e)}, status=500)
+                return _json_response({'status': 'error', 'message': str(e)}, status=500)
         
         # Root endpoint
         async def root(request):
-            html = """
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>YouTube Downloader Telegram Bot</title>
-                <style>
-                    body { font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; line-height: 1.6; }
-                    .container { background: #f5f5f5; padding: 30px; border-radius: 10px; margin-top: 20px; }
-                    .status { padding: 15px; border-radius: 5px; margin: 10px 0; }
-                    .status-ok { background: #d4edda; color: #155724; }
-                    .status-error { background: #f8d7da; color: #721c24; }
-                    .endpoints { background: #fff; padding: 20px; border-radius: 5px; margin-top: 20px; }
-                    code { background: #eee; padding: 2px 5px; border-radius: 3px; }
-                </style>
-            </head>
-            <body>
-                <h1>🎬 YouTube Downloader Telegram Bot</h1>
-                <p>This is a Telegram bot that downloads YouTube videos and sends them to users.</p>
-                
-                <div class="container">
-                    <h2>📊 Bot Status</h2>
-                    <div class="status" id="status">Loading status...</div>
-                    
-                    <h2>🔗 Endpoints</h2>
-                    <div class="endpoints">
-                        <p><strong>Health Check:</strong> <code><a href="/health">/health</a></code></p>
-                        <p><strong>Status:</strong> <code><a href="/status">/status</a></code></p>
-                        <p><strong>Home:</strong> <code><a href="/">/</a></code></p>
-                    </div>
-                    
-                    <h2>📱 How to Use</h2>
-                    <p>1. Find the bot on Telegram: <code>@YourBotUsername</code></p>
-                    <p>2. Send <code>/start</code> to begin</p>
-                    <p>3. Use <code>/yt</code> to download videos</p>
-                </div>
-                
-                <script>
-                    async function updateStatus() {
-                        try {
-                            const response = await fetch('/health');
-                            const data = await response.json();
-                            document.getElementById('status').innerHTML = 
-                                `<div class="status-ok">✅ Bot is running (Active downloads: ${data.active_downloads})</div>`;
-                        } catch (error) {
-                            document.getElementById('status').innerHTML = 
-                                `<div class="status-error">❌ Error: ${error.message}</div>`;
-                        }
-                    }
-                    
-                    updateStatus();
-                    setInterval(updateStatus, 30000);
-                </script>
-            </body>
-            </html>
-            """
-            return web.Response(text=html, content_type='text/html')
+            return web.Response(body=_ROOT_HTML_BYTES, content_type='text/html', charset='utf-8',
+                                headers={'Cache-Control': 'public, max-age=300'})
         
         # Add routes
-        app.router.add_get('/', root)
-        app.router.add_get('/health', health_check)
-        app.router.add_get('/status', status)
+        app.add_routes([
+            web.get('/', root),
+            web.get('/health', health_check),
+            web.get('/status', status),
+        ])
         
-        # Start server
-        runner = web.AppRunner(app)
+        # Start server; no access log for the constant health-check traffic,
+        # and keep connections open so repeated probes reuse them
+        runner = web.AppRunner(app, access_log=None, keepalive_timeout=75, shutdown_timeout=5.0)
         await runner.setup()
-        site = web.TCPSite(runner, '0.0.0.0', self.config['port'])
+        site = web.TCPSite(runner, '0.0.0.0', self.config.port, backlog=128)
         await site.start()
         
-        logger.info(f"🌐 Web server started on port {self.config['port']}")
+        logger.info(f"🌐 Web server started on port {self.config.port}")
         self.runner = runner
         
         return runner
     
-    async def check_user_access(self, user_id: int) -> bool:
-        """Check if user is allowed to use bot"""
-        if not self.config['allowed_users']:
-            return True
+    def now_iso(self) -> str:
+        """Current time as an ISO string, reformatted at most once per second"""
+        now = time.monotonic()
+        timestamp, iso = self._now_iso
+        if now - timestamp >= 1.0:
+            iso = datetime.now().isoformat()
+            self._now_iso = (now, iso)
+        return iso
+    
+    async def get_system_metrics(self) -> Tuple[float, float, float]:
+        """Get (cpu, memory, disk) usage percentages as last sampled in the background"""
+        timestamp, metrics = self._sys_metrics_cache
+        if metrics is not None and time.monotonic() - timestamp < 10.0:
+            return metrics
+        return await self.sample_system_metrics()
+    
+    async def sample_system_metrics(self) -> Tuple[float, float, float]:
+        """Sample usage percentages in a worker thread and cache them"""
+        def sample():
+            return (
+                psutil.cpu_percent(interval=None),
+                psutil.virtual_memory().percent,
+                psutil.disk_usage('/').percent
+            )
         
-        return str(user_id) in self.config['allowed_users']
+        metrics = await asyncio.get_running_loop().run_in_executor(None, sample)
+        self._sys_metrics_cache = (time.monotonic(), metrics)
+        return metrics
+    
+    async def system_metrics_sampler(self):
+        """Refresh the cached system metrics and user state count every 5 seconds"""
+        while True:
+            self._user_states_count = len(self.user_states)
+            try:
+                await self.sample_system_metrics()
+            except Exception as e:
+                logger.warning(f"Error sampling system metrics: {e}")
+            await asyncio.sleep(5.0)
     
-    async def check_admin_access(self, user_id: int) -> bool:
+    def check_user_access(self, user_id: int) -> bool:
+        """Check if user is allowed to use bot"""
+        return not self.allowed_ids or user_id in self.allowed_ids
+    
+    def check_admin_access(self, user_id: int) -> bool:
         """Check if user is admin"""
-        if not self.admin_ids:
-            return False
-        
-        return str(user_id) in self.admin_ids
+        return user_id in self.admin_ids
     
     async def start_client(self):
         """Initialize and start Telegram client"""
@@ -357,10 +745,12 @@ class YouTubeDownloaderBot:
         
         self.app = Client(
             "youtube_downloader_bot",
-            api_id=self.config['api_id'],
-            api_hash=self.config['api_hash'],
-            bot_token=self.config['bot_token'],
-            workdir=self.config['temp_dir']
+            api_id=self.config.api_id,
+            api_hash=self.config.api_hash,
+            bot_token=self.config.bot_token,
+            workdir=self.config.temp_dir,
+            workers=min(32, (os.cpu_count() or 1) * 4),
+            max_concurrent_transmissions=self.config.max_concurrent_transmissions
         )
         
         # Register handlers
@@ -380,59 +770,33 @@ class YouTubeDownloaderBot:
         
         @self.app.on_message(filters.command(["start", "help"]))
         async def start_command(client, message: Message):
-            if not await self.check_user_access(message.from_user.id):
+            if not self.check_user_access(message.from_user.id):
                 await message.reply("❌ You are not authorized to use this bot.")
                 return
             
             cookies_status = "✅ Active" if self.cookies_available else "❌ Not configured"
             
             admin_commands = ""
-            if await self.check_admin_access(message.from_user.id):
-                admin_commands = (
-                    "\n\n**👑 Admin Commands:**\n"
-                    "• /cookies_info - View detailed cookies info\n"
-                    "• /cookies_upload - Upload new cookies file (in private chat)\n"
-                    "• /getcookies - Download current cookies file (in private chat)\n"
-                    "• /cookies_backup - Backup current cookies\n"
-                    "• /cookies_test - Test cookies with YouTube\n"
-                    "• /cookies_delete - Delete cookies file\n"
-                    "• /cookies_refresh - Refresh cookies status\n"
-                )
-            
-            await message.reply(
-                "🎬 **YouTube Video Downloader Bot**\n\n"
-                "**📋 Commands:**\n"
-                "• /yt - Download a YouTube video\n"
-                "• /batch - Download multiple videos from text file\n"
-                "• /status - Check bot status\n"
-                "• /cookies_status - Check cookies status\n"
-                "• /stop - Cancel current download\n"
-                "• /help - Show this message"
-                f"{admin_commands}"
-                "\n\n**⚙️ Limits:**\n"
-                f"• Max duration: {self.config['max_duration']//60} minutes\n"
-                "• Supported resolutions: 144p, 240p, 360p, 480p, 720p, 1080p\n"
-                "• Format: MP4/MKV\n\n"
-                f"**🍪 Cookies Status:** {cookies_status}\n"
-                "• Age-restricted videos require cookies\n\n"
-                "**📖 Usage:**\n"
-                "1. Send /yt\n"
-                "2. Reply with a YouTube URL\n"
-                "3. Select resolution (default: 720p)"
-            )
+            if self.check_admin_access(message.from_user.id):
+                admin_commands = _ADMIN_COMMANDS_TEXT
+            
+            await message.reply(_START_TEMPLATE.format_map({
+                'admin_commands': admin_commands,
+                'max_min': self.config.max_duration // 60,
+                'cookies_status': cookies_status,
+            }))
         
         @self.app.on_message(filters.command("yt"))
         async def yt_command(client, message: Message):
             """Handle /yt command"""
-            if not await self.check_user_access(message.from_user.id):
+            if not self.check_user_access(message.from_user.id):
                 await message.reply("❌ You are not authorized to use this bot.")
                 return
             
             user_id = message.from_user.id
             
             # Check concurrent downloads limit
-            active_count = sum(1 for uid in self.active_downloads.values() if uid == user_id)
-            if active_count >= self.config['max_concurrent']:
+            if self._active_per_user.get(user_id, 0) >= self.config.max_concurrent:
                 await message.reply("⏳ You have too many active downloads. Please wait for them to complete.")
                 return
             
@@ -441,7 +805,7 @@ class YouTubeDownloaderBot:
                 await message.reply("⏳ Please finish your current download first.")
                 return
             
-            self.user_states[user_id] = {"state": "waiting_for_url", "message_id": message.id}
+            self.user_states[user_id] = UserState("waiting_for_url", message.id)
             
             # Ask for resolution
             resolution_keyboard = InlineKeyboardMarkup(
@@ -469,15 +833,14 @@ class YouTubeDownloaderBot:
         @self.app.on_message(filters.command("batch"))
         async def batch_command(client, message: Message):
             """Handle batch download from text file"""
-            if not await self.check_user_access(message.from_user.id):
+            if not self.check_user_access(message.from_user.id):
                 await message.reply("❌ You are not authorized to use this bot.")
                 return
             
             user_id = message.from_user.id
             
             # Check concurrent downloads limit
-            active_count = sum(1 for uid in self.active_downloads.values() if uid == user_id)
-            if active_count >= self.config['max_concurrent']:
+            if self._active_per_user.get(user_id, 0) >= self.config.max_concurrent:
                 await message.reply("⏳ You have too many active downloads. Please wait for them to complete.")
                 return
             
@@ -486,7 +849,7 @@ class YouTubeDownloaderBot:
                 await message.reply("⏳ Please finish your current download first.")
                 return
             
-            self.user_states[user_id] = {"state": "waiting_for_batch", "message_id": message.id}
+            self.user_states[user_id] = UserState("waiting_for_batch", message.id)
             
             await message.reply(
                 "📁 **Batch Download**\n\n"
@@ -536,11 +899,7 @@ class YouTubeDownloaderBot:
                 else:
                     resolution = resolution.replace("p", "")
                 
-                self.user_states[user_id] = {
-                    "state": "waiting_for_url",
-                    "resolution": resolution,
-                    "message_id": callback_query.message.id
-                }
+                self.user_states[user_id] = UserState("waiting_for_url", callback_query.message.id, resolution)
                 
                 await callback_query.message.edit_text(
                     f"📏 **Resolution selected:** {resolution if resolution == 'best' else resolution + 'p'}\n\n"
@@ -555,7 +914,7 @@ class YouTubeDownloaderBot:
                 await callback_query.answer()
             
             elif data == "delete_cookies_yes":
-                if not await self.check_admin_access(user_id):
+                if not self.check_admin_access(user_id):
                     await callback_query.answer("Admin access required.", show_alert=True)
                     return
                 
@@ -564,10 +923,11 @@ class YouTubeDownloaderBot:
                     self.backup_current_cookies()
                     
                     # Delete cookies file
-                    if os.path.exists(self.config['cookies_path']):
-                        os.remove(self.config['cookies_path'])
-                        self.cookies_available = False
-                        self.cookies_metadata = {}
+                    if os.path.exists(self.config.cookies_path):
+                        os.remove(self.config.cookies_path)
+                        self.cookies_meta = CookiesMeta()
+                        self._cookies_cache_key = None
+                        self.reset_probe_ydl()
                         
                         await callback_query.message.edit_text(
                             "✅ **Cookies Deleted Successfully**\n\n"
@@ -592,26 +952,19 @@ class YouTubeDownloaderBot:
         async def status_command(client, message: Message):
             """Check bot status"""
             try:
-                import psutil
-                import platform
-                
                 # System info
-                cpu_percent = psutil.cpu_percent()
-                memory = psutil.virtual_memory()
-                disk = psutil.disk_usage('/')
+                cpu_percent, memory_percent, disk_percent = await self.get_system_metrics()
                 
-                status_text = (
-                    "🤖 **Bot Status**\n\n"
-                    f"**System:** {platform.system()} {platform.release()}\n"
-                    f"**CPU Usage:** {cpu_percent}%\n"
-                    f"**Memory:** {memory.percent}% used\n"
-                    f"**Disk:** {disk.percent}% used\n"
-                    f"**Active Downloads:** {len(self.active_downloads)}\n"
-                    f"**Cookies:** {'✅ Available' if self.cookies_available else '❌ Not configured'}\n"
-                    f"**Temp Directory:** {self.config['temp_dir']}\n"
-                    f"**Web Server:** ✅ Running on port {self.config['port']}\n\n"
-                    "✅ Bot is running normally"
-                )
+                status_text = _STATUS_TEMPLATE.format_map({
+                    'system': f"{platform.system()} {platform.release()}",
+                    'cpu_percent': cpu_percent,
+                    'memory_percent': memory_percent,
+                    'disk_percent': disk_percent,
+                    'active_downloads': len(self.active_downloads),
+                    'cookies': '✅ Available' if self.cookies_available else '❌ Not configured',
+                    'temp_dir': self.config.temp_dir,
+                    'port': self.config.port,
+                })
                 
                 await message.reply(status_text)
             except Exception as e:
@@ -622,28 +975,9 @@ class YouTubeDownloaderBot:
         async def cookies_status_command(client, message: Message):
             """Check cookies status"""
             if self.cookies_available:
-                cookies_text = (
-                    "🍪 **Cookies Status**\n\n"
-                    f"✅ **Status:** Active and working\n"
-                    f"📁 **Location:** `{self.config['cookies_path']}`\n"
-                    f"📏 **Size:** {self.cookies_metadata.get('size', 0)} bytes\n"
-                    f"📅 **Last Modified:** {self.cookies_metadata.get('modified', 'Unknown')}\n"
-                    f"🔄 **Format:** {self.cookies_metadata.get('format', 'Unknown')}\n"
-                    f"📊 **Lines:** {self.cookies_metadata.get('line_count', 0)}\n"
-                    f"🌐 **Domains:** {self.cookies_metadata.get('domain_count', 0)}\n\n"
-                    "✅ **Age-restricted videos:** Supported"
-                )
+                cookies_text = _COOKIES_STATUS_TEMPLATE.format_map(asdict(self.cookies_meta))
             else:
-                cookies_text = (
-                    "🍪 **Cookies Status**\n\n"
-                    "❌ **Status:** Not configured or invalid\n\n"
-                    "**Without cookies:**\n"
-                    "• Age-restricted videos will fail\n"
-                    "• Some videos may require sign-in\n"
-                    "• YouTube may block some requests\n\n"
-                    "**To fix:**\n"
-                    "Contact an admin to upload cookies."
-                )
+                cookies_text = _COOKIES_MISSING_TEXT
             
             await message.reply(cookies_text)
         
@@ -652,7 +986,7 @@ class YouTubeDownloaderBot:
         @self.app.on_message(filters.command("cookies_upload"))
         async def cookies_upload_command(client, message: Message):
             """Start cookies upload process (Admin only)"""
-            if not await self.check_admin_access(message.from_user.id):
+            if not self.check_admin_access(message.from_user.id):
                 await message.reply("❌ Admin access required for this command.")
                 return
             
@@ -676,7 +1010,7 @@ class YouTubeDownloaderBot:
         @self.app.on_message(filters.command("getcookies"))
         async def getcookies_handler(client, message: Message):
             """Handle cookies download"""
-            if not await self.check_admin_access(message.from_user.id):
+            if not self.check_admin_access(message.from_user.id):
                 await message.reply("❌ Admin access required for this command.")
                 return
             
@@ -687,11 +1021,11 @@ class YouTubeDownloaderBot:
             try:
                 await client.send_document(
                     chat_id=message.chat.id,
-                    document=self.config['cookies_path'],
+                    document=self.config.cookies_path,
                     caption=f"📁 **YouTube Cookies File**\n\n"
-                           f"**Size:** {self.cookies_metadata.get('size', 0)} bytes\n"
-                           f"**Modified:** {self.cookies_metadata.get('modified', 'Unknown')}\n"
-                           f"**Format:** {self.cookies_metadata.get('format', 'Unknown')}\n\n"
+                           f"**Size:** {self.cookies_meta.size} bytes\n"
+                           f"**Modified:** {self.cookies_meta.modified}\n"
+                           f"**Format:** {self.cookies_meta.format}\n\n"
                            "⚠️ **Keep this file secure!**"
                 )
             except Exception as e:
@@ -702,7 +1036,7 @@ class YouTubeDownloaderBot:
         @self.app.on_message(filters.command("cookies_backup"))
         async def cookies_backup_command(client, message: Message):
             """Backup current cookies (Admin only)"""
-            if not await self.check_admin_access(message.from_user.id):
+            if not self.check_admin_access(message.from_user.id):
                 await message.reply("❌ Admin access required for this command.")
                 return
             
@@ -728,7 +1062,7 @@ class YouTubeDownloaderBot:
         @self.app.on_message(filters.command("cookies_test"))
         async def cookies_test_command(client, message: Message):
             """Test cookies with YouTube (Admin only)"""
-            if not await self.check_admin_access(message.from_user.id):
+            if not self.check_admin_access(message.from_user.id):
                 await message.reply("❌ Admin access required for this command.")
                 return
             
@@ -742,48 +1076,40 @@ class YouTubeDownloaderBot:
                 # Test with a simple YouTube request
                 test_url = "https://www.youtube.com/"
                 
-                ydl_opts = {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'extract_flat': True,
-                    'cookiefile': self.config['cookies_path'],
-                    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'http_headers': {
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                        'Accept-Language': 'en-US,en;q=0.5',
-                        'Accept-Encoding': 'gzip, deflate',
-                        'DNT': '1',
-                        'Connection': 'keep-alive',
-                        'Upgrade-Insecure-Requests': '1',
-                    }
-                }
+                def probe():
+                    with self._ydl_probe_lock:
+                        return self.get_probe_ydl().extract_info(test_url, download=False)
                 
-                # Add proxy if configured
-                if self.config.get('proxy_url'):
-                    ydl_opts['proxy'] = self.config['proxy_url']
+                # Keep the network-bound probe off the event loop
+                info = await asyncio.wait_for(
+                    asyncio.to_thread(probe),
+                    timeout=self.config.yt_dlp_timeout
+                )
                 
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(test_url, download=False)
+                if info:
+                    await status_msg.edit_text(
+                        "✅ **Cookies Test Successful!**\n\n"
+                        "Your cookies are working correctly with YouTube.\n\n"
+                        "**Details:**\n"
+                        f"• Cookies file: {self.config.cookies_path}\n"
+                        f"• File size: {self.cookies_meta.size} bytes\n\n"
+                        "Age-restricted videos should now work."
+                    )
+                else:
+                    await status_msg.edit_text(
+                        "⚠️ **Cookies Test Inconclusive**\n\n"
+                        "Could not retrieve YouTube information.\n"
+                        "This doesn't necessarily mean cookies are invalid.\n"
+                        "Try downloading a video to test functionality."
+                    )
                     
-                    if info:
-                        await status_msg.edit_text(
-                            "✅ **Cookies Test Successful!**\n\n"
-                            "Your cookies are working correctly with YouTube.\n\n"
-                            "**Details:**\n"
-                            f"• Cookies file: {self.config['cookies_path']}\n"
-                            f"• File size: {self.cookies_metadata.get('size', 0)} bytes\n\n"
-                            "Age-restricted videos should now work."
-                        )
-                    else:
-                        await status_msg.edit_text(
-                            "⚠️ **Cookies Test Inconclusive**\n\n"
-                            "Could not retrieve YouTube information.\n"
-                            "This doesn't necessarily mean cookies are invalid.\n"
-                            "Try downloading a video to test functionality."
-                        )
-                        
+            except asyncio.TimeoutError:
+                await status_msg.edit_text(
+                    "⚠️ **Cookies Test Timed Out**\n\n"
+                    f"YouTube did not respond within {self.config.yt_dlp_timeout} seconds.\n"
+                    "Try again later."
+                )
             except Exception as e:
-                error_msg = str(e).lower()
                 await status_msg.edit_text(
                     f"❌ **Cookies Test Failed**\n\n"
                     f"**Error:** {str(e)[:200]}\n\n"
@@ -798,7 +1124,7 @@ class YouTubeDownloaderBot:
         @self.app.on_message(filters.command("cookies_info"))
         async def cookies_info_command(client, message: Message):
             """Detailed cookies information (Admin only)"""
-            if not await self.check_admin_access(message.from_user.id):
+            if not self.check_admin_access(message.from_user.id):
                 await message.reply("❌ Admin access required for this command.")
                 return
             
@@ -808,28 +1134,25 @@ class YouTubeDownloaderBot:
             
             try:
                 # Read sample of cookies
-                sample_lines = []
-                with open(self.config['cookies_path'], 'r', encoding='utf-8', errors='ignore') as f:
-                    for i, line in enumerate(f):
-                        if i < 10:  # First 10 lines
-                            sample_lines.append(line.rstrip())
-                        else:
-                            break
+                with open(self.config.cookies_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    sample_lines = [line.rstrip() for line in islice(f, 10)]  # First 10 lines
                 
-                info_text = (
+                parts = [
                     "🍪 **Detailed Cookies Information**\n\n"
-                    f"**Path:** `{self.config['cookies_path']}`\n"
-                    f"**Size:** {self.cookies_metadata.get('size', 0)} bytes\n"
-                    f"**Modified:** {self.cookies_metadata.get('modified', 'Unknown')}\n"
-                    f"**Format:** {self.cookies_metadata.get('format', 'Unknown')}\n"
-                    f"**Total Lines:** {self.cookies_metadata.get('line_count', 0)}\n"
-                    f"**Unique Domains:** {self.cookies_metadata.get('domain_count', 0)}\n\n"
-                    "**Sample Lines:**\n"
-                )
+                    f"**Path:** `{self.config.cookies_path}`\n"
+                    f"**Size:** {self.cookies_meta.size} bytes\n"
+                    f"**Modified:** {self.cookies_meta.modified}\n"
+                    f"**Format:** {self.cookies_meta.format}\n"
+                    f"**Total Lines:** {self.cookies_meta.line_count}\n"
+                    f"**Unique Domains:** {self.cookies_meta.domain_count}\n\n"
+                    "**Sample Lines:**"
+                ]
                 
                 for i, line in enumerate(sample_lines, 1):
-                    info_text += f"{i}. `{line[:50]}{'...' if len(line) > 50 else ''}`\n"
+                    truncated = line[:50] + ('...' if len(line) > 50 else '')
+                    parts.append(f"{i}. `{truncated}`")
                 
+                info_text = "\n".join(parts) + "\n"
                 await message.reply(info_text[:4000])  # Telegram limit
                 
             except Exception as e:
@@ -839,7 +1162,7 @@ class YouTubeDownloaderBot:
         @self.app.on_message(filters.command("cookies_delete"))
         async def cookies_delete_command(client, message: Message):
             """Delete cookies file (Admin only)"""
-            if not await self.check_admin_access(message.from_user.id):
+            if not self.check_admin_access(message.from_user.id):
                 await message.reply("❌ Admin access required for this command.")
                 return
             
@@ -857,9 +1180,9 @@ class YouTubeDownloaderBot:
             
             await message.reply(
                 "⚠️ **Delete Cookies File?**\n\n"
-                f"**File:** `{self.config['cookies_path']}`\n"
-                f"**Size:** {self.cookies_metadata.get('size', 0)} bytes\n"
-                f"**Last Modified:** {self.cookies_metadata.get('modified', 'Unknown')}\n\n"
+                f"**File:** `{self.config.cookies_path}`\n"
+                f"**Size:** {self.cookies_meta.size} bytes\n"
+                f"**Last Modified:** {self.cookies_meta.modified}\n\n"
                 "**Warning:** This will remove all cookies.\n"
                 "Age-restricted videos will stop working.\n\n"
                 "Are you sure you want to delete the cookies file?",
@@ -869,7 +1192,7 @@ class YouTubeDownloaderBot:
         @self.app.on_message(filters.command("cookies_refresh"))
         async def cookies_refresh_command(client, message: Message):
             """Manually refresh cookies status (Admin only)"""
-            if not await self.check_admin_access(message.from_user.id):
+            if not self.check_admin_access(message.from_user.id):
                 await message.reply("❌ Admin access required for this command.")
                 return
             
@@ -883,15 +1206,15 @@ class YouTubeDownloaderBot:
                     await status_msg.edit_text(
                         "✅ **Cookies Refreshed**\n\n"
                         f"Cookies are still active.\n"
-                        f"Size: {self.cookies_metadata.get('size', 0)} bytes\n"
-                        f"Modified: {self.cookies_metadata.get('modified', 'Unknown')}"
+                        f"Size: {self.cookies_meta.size} bytes\n"
+                        f"Modified: {self.cookies_meta.modified}"
                     )
                 else:
                     await status_msg.edit_text(
                         "✅ **Cookies Restored**\n\n"
                         f"Cookies are now active!\n"
-                        f"Size: {self.cookies_metadata.get('size', 0)} bytes\n"
-                        f"Modified: {self.cookies_metadata.get('modified', 'Unknown')}"
+                        f"Size: {self.cookies_meta.size} bytes\n"
+                        f"Modified: {self.cookies_meta.modified}"
                     )
             else:
                 await status_msg.edit_text("❌ No valid cookies file found.")
@@ -922,7 +1245,8 @@ class YouTubeDownloaderBot:
                     return
             
             # Check if user is in batch upload state
-            if user_id in self.user_states and self.user_states[user_id].get("state") == "waiting_for_batch":
+            user_state = self.user_states.get(user_id)
+            if user_state is not None and user_state.state == "waiting_for_batch":
                 await self.handle_batch_upload(message)
         
         # Handle text messages
@@ -937,20 +1261,15 @@ class YouTubeDownloaderBot:
                 return
             
             # Check if user is waiting for URL
-            if user_id in self.user_states:
-                user_state = self.user_states[user_id]
-                
-                if user_state.get("state") == "waiting_for_url":
-                    logger.info(f"User {user_id} is waiting for URL, processing...")
+            user_state = self.user_states.get(user_id)
+            if user_state is not None:
+                if user_state.state == "waiting_for_url":
+                    logger.debug("User %s is waiting for URL, processing...", user_id)
                     
                     # Check if text is a resolution number
                     if text.isdigit() and int(text) in [144, 240, 360, 480, 720, 1080]:
                         # Store resolution and ask for URL
-                        self.user_states[user_id] = {
-                            "state": "waiting_for_url",
-                            "resolution": text,
-                            "message_id": user_state.get("message_id")
-                        }
+                        self.user_states[user_id] = UserState("waiting_for_url", user_state.message_id, text)
                         
                         await message.reply(
                             f"📏 **Resolution set to {text}p**\n\n"
@@ -965,11 +1284,7 @@ class YouTubeDownloaderBot:
                         return
                     elif text.lower() == "best":
                         # Store best resolution and ask for URL
-                        self.user_states[user_id] = {
-                            "state": "waiting_for_url",
-                            "resolution": "best",
-                            "message_id": user_state.get("message_id")
-                        }
+                        self.user_states[user_id] = UserState("waiting_for_url", user_state.message_id, "best")
                         
                         await message.reply(
                             "📏 **Resolution set to Best Available**\n\n"
@@ -988,13 +1303,13 @@ class YouTubeDownloaderBot:
                         await message.reply("❌ Invalid YouTube URL. Please send a valid YouTube link.")
                         return
                     
-                    logger.info(f"URL validated: {text}")
+                    logger.debug("URL validated: %s", text)
                     
                     # Get resolution from user state or default to 720
-                    resolution = user_state.get("resolution", "720")
+                    resolution = user_state.resolution
                     
                     # Remove user from waiting state immediately
-                    del self.user_states[user_id]
+                    self.user_states.pop(user_id, None)
                     
                     # Start processing in background
                     asyncio.create_task(self.process_video(message, text, resolution))
@@ -1019,76 +1334,72 @@ class YouTubeDownloaderBot:
         document = message.document
         if not document:
             await message.reply("❌ Please send a file, not text.")
-            del self.cookie_upload_states[user_id]
+            self.cookie_upload_states.pop(user_id, None)
             return
         
         # Check file name
         file_name = document.file_name.lower()
         if not (file_name == 'cookies.txt' or file_name.endswith('.txt')):
             await message.reply("❌ File must be a .txt file, preferably named 'cookies.txt'")
-            del self.cookie_upload_states[user_id]
+            self.cookie_upload_states.pop(user_id, None)
             return
         
         # Check file size
         if document.file_size > 1024 * 1024:  # 1MB
             await message.reply("❌ File too large. Maximum size is 1MB.")
-            del self.cookie_upload_states[user_id]
+            self.cookie_upload_states.pop(user_id, None)
             return
         
         if document.file_size < 100:
             await message.reply("❌ File too small. Minimum size is 100 bytes.")
-            del self.cookie_upload_states[user_id]
+            self.cookie_upload_states.pop(user_id, None)
             return
         
         status_msg = await message.reply("📥 Downloading cookies file...")
         
         try:
-            # Download the file
-            temp_dir = tempfile.mkdtemp()
-            temp_path = os.path.join(temp_dir, "cookies_temp.txt")
-            
-            await message.download(temp_path)
+            # Download the file into memory and validate it there; it is
+            # at most 1MB, so there's no need for a temporary copy on disk
+            buffer = await message.download(in_memory=True)
+            data = buffer.getvalue()
             
             # Validate the file
-            is_valid, validation_msg = self.validate_cookies_file(temp_path)
+            is_valid, validation_msg = self.validate_cookies_data(data)
             
             if not is_valid:
                 await status_msg.edit_text(f"❌ Invalid cookies file:\n\n{validation_msg}")
-                shutil.rmtree(temp_dir)
-                del self.cookie_upload_states[user_id]
+                self.cookie_upload_states.pop(user_id, None)
                 return
             
             # Backup current cookies
             self.backup_current_cookies()
             
-            # Replace current cookies
-            shutil.copy2(temp_path, self.config['cookies_path'])
+            # Replace current cookies with a new file rather than writing into
+            # the existing inode, so readers never see a half-written file
+            staging_path = self.config.cookies_path + '.new'
+            with open(staging_path, 'wb') as f:
+                f.write(data)
+            os.replace(staging_path, self.config.cookies_path)
             
             # Update cookies metadata
+            self._cookies_cache_key = None
             self.check_cookies_file()
             
-            # Cleanup
-            shutil.rmtree(temp_dir)
-            del self.cookie_upload_states[user_id]
+            self.cookie_upload_states.pop(user_id, None)
             
             await status_msg.edit_text(
                 f"✅ **Cookies Updated Successfully!**\n\n"
                 f"{validation_msg}\n\n"
-                f"**New File:** `{self.config['cookies_path']}`\n"
-                f"**Size:** {self.cookies_metadata.get('size', 0)} bytes\n"
-                f"**YouTube Cookies:** {self.cookies_metadata.get('domain_count', 0)} domains\n\n"
+                f"**New File:** `{self.config.cookies_path}`\n"
+                f"**Size:** {self.cookies_meta.size} bytes\n"
+                f"**YouTube Cookies:** {self.cookies_meta.domain_count} domains\n\n"
                 "✅ Age-restricted videos should now work."
             )
             
         except Exception as e:
             logger.error(f"Error handling cookies upload: {e}")
             await status_msg.edit_text(f"❌ Error uploading cookies: {str(e)[:200]}")
-            if 'temp_dir' in locals():
-                try:
-                    shutil.rmtree(temp_dir)
-                except:
-                    pass
-            del self.cookie_upload_states[user_id]
+            self.cookie_upload_states.pop(user_id, None)
     
     async def handle_batch_upload(self, message: Message):
         """Handle batch .txt file upload"""
@@ -1098,35 +1409,28 @@ class YouTubeDownloaderBot:
         document = message.document
         if not document:
             await message.reply("❌ Please send a file, not text.")
-            del self.user_states[user_id]
+            self.user_states.pop(user_id, None)
             return
         
         # Check file name
         if not document.file_name.endswith('.txt'):
             await message.reply("❌ File must be a .txt file")
-            del self.user_states[user_id]
+            self.user_states.pop(user_id, None)
             return
         
         status_msg = await message.reply("📥 Downloading batch file...")
         
         try:
-            # Download the file
-            temp_dir = tempfile.mkdtemp()
-            temp_path = os.path.join(temp_dir, "batch_temp.txt")
-            
-            await message.download(temp_path)
-            
-            # Read URLs from file
-            with open(temp_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+            # Download the file straight into memory; it's only read once
+            buffer = await message.download(in_memory=True)
+            content = buffer.getvalue().decode('utf-8', errors='ignore')
             
             lines = [line.strip() for line in content.split('\n') if line.strip()]
             youtube_urls = [line for line in lines if self.validate_youtube_url(line)]
             
             if not youtube_urls:
                 await status_msg.edit_text("❌ No valid YouTube URLs found in the file.")
-                shutil.rmtree(temp_dir)
-                del self.user_states[user_id]
+                self.user_states.pop(user_id, None)
                 return
             
             # Ask for resolution
@@ -1144,12 +1448,7 @@ class YouTubeDownloaderBot:
             )
             
             # Store batch data
-            self.user_states[user_id] = {
-                "state": "waiting_for_batch_resolution",
-                "urls": youtube_urls,
-                "temp_dir": temp_dir,
-                "temp_path": temp_path
-            }
+            self.user_states[user_id] = UserState("waiting_for_batch_resolution", urls=youtube_urls)
             
             await status_msg.edit_text(
                 f"✅ **Found {len(youtube_urls)} valid YouTube URLs**\n\n"
@@ -1163,90 +1462,129 @@ class YouTubeDownloaderBot:
         except Exception as e:
             logger.error(f"Error handling batch upload: {e}")
             await status_msg.edit_text(f"❌ Error processing batch file: {str(e)[:200]}")
-            if 'temp_dir' in locals():
-                try:
-                    shutil.rmtree(temp_dir)
-                except:
-                    pass
-            del self.user_states[user_id]
+            self.user_states.pop(user_id, None)
     
     def validate_youtube_url(self, url: str) -> bool:
         """Validate YouTube URL with improved patterns"""
-        # Clean the URL
-        url = url.strip()
-        
-        # Remove any extra spaces or quotes
-        url = url.replace('"', '').replace("'", "")
-        
-        patterns = [
-            r'(?:https?://)?(?:www\.)?youtube\.com/watch\?(?:.*&)?v=[\w-]+',
-            r'(?:https?://)?youtu\.be/[\w-]+',
-            r'(?:https?://)?(?:www\.)?youtube\.com/shorts/[\w-]+',
-            r'(?:https?://)?(?:www\.)?youtube\.com/playlist\?list=[\w-]+',
-            r'(?:https?://)?(?:www\.)?youtube\.com/embed/[\w-]+',
-            r'(?:https?://)?m\.youtube\.com/watch\?v=[\w-]+',
-            r'(?:https?://)?(?:www\.)?youtube\.com/watch\?[\w=&%-]+v=[\w-]+[\w=&%-]*',
-        ]
-        
-        for pattern in patterns:
-            if re.match(pattern, url, re.IGNORECASE):
-                return True
+        # Remove any extra spaces or quotes around the link
+        return self.is_youtube_url(url.strip(' \t\n\r\'"'))
+    
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def is_youtube_url(url: str) -> bool:
+        """Match a cleaned URL against the YouTube patterns (memoized)"""
+        # Most chat text isn't a link at all; skip the regex for it
+        url_lower = url.lower()
+        if 'youtu' not in url_lower:
+            return False
         
-        # Also check if it contains youtube.com or youtu.be even if pattern didn't match exactly
-        if 'youtube.com' in url.lower() or 'youtu.be' in url.lower():
+        if _YT_URL_RE.match(url):
             return True
         
-        return False
+        # Also check if it contains youtube.com or youtu.be even if pattern didn't match exactly
+        return 'youtube.com' in url_lower or 'youtu.be' in url_lower
     
     async def process_video(self, message: Message, url: str, resolution: str = "720"):
-        """Main processing pipeline with enhanced error handling"""
-        user_id = message.from_user.id
-        task_id = f"{user_id}_{int(asyncio.get_event_loop().time())}"
+        """Main processing pipeline with enhanced error handling
         
+        Identical requests share one download: later ones wait for the
+        running one and then copy the video it sent.
+        """
+        user_id = message.from_user.id
+        self._active_per_user[user_id] += 1
         try:
-            # Track active download
-            self.active_downloads[task_id] = user_id
-            self.download_states[user_id] = {'cancelled': False}
-            
-            # Send initial processing message
-            progress_msg = await message.reply(
-                f"🔍 **Processing Request**\n\n"
-                f"**URL:** [Click Here]({url})\n"
-                f"**Resolution:** {resolution if resolution == 'best' else resolution + 'p'}\n\n"
-                f"🔄 Fetching video information..."
-            )
+            video_key = self.video_key(url, resolution)
+            if video_key is None:
+                await self.download_and_send(message, url, resolution)
+                return
             
-            # Create user-specific temp directory
-            user_temp_dir = os.path.join(self.config['temp_dir'], f"user_{user_id}_{int(time.time())}")
-            os.makedirs(user_temp_dir, exist_ok=True)
+            while (inflight := self._inflight.get(video_key)) is not None:
+                await asyncio.shield(inflight)
+            if await self.send_cached_video(message, video_key):
+                return
             
-            # First, extract video info to check if video exists
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[video_key] = future
             try:
-                ydl_opts = {
-                    'quiet': True,
-                    'no_warnings': False,
-                    'extract_flat': False,
-                    'skip_download': True,
-                    'force_generic_extractor': False,
-                }
+                await self.download_and_send(message, url, resolution, video_key)
+            finally:
+                del self._inflight[video_key]
+                future.set_result(None)
+        finally:
+            self._active_per_user[user_id] -= 1
+            if not self._active_per_user[user_id]:
+                del self._active_per_user[user_id]
+    
+    def video_key(self, url: str, resolution: str) -> Optional[Tuple[str, str]]:
+        """Key identical requests by video ID and resolution"""
+        match = _YT_VIDEO_ID_RE.search(url)
+        return (match.group(1), resolution) if match else None
+    
+    async def send_cached_video(self, message: Message, video_key: Tuple[str, str]) -> bool:
+        """Copy a recently sent video instead of downloading it again"""
+        sent = self._sent_videos.get(video_key)
+        if sent is None:
+            return False
+        
+        try:
+            await self.telegram_send(
+                lambda: self.app.copy_message(message.chat.id, from_chat_id=sent[0], message_id=sent[1])
+            )
+            return True
+        except RPCError as e:
+            logger.warning("Could not reuse sent video %s: %s", video_key[0], e)
+            self._sent_videos.pop(video_key, None)
+            return False
+    
+    async def download_and_send(self, message: Message, url: str, resolution: str,
+                                video_key: Optional[Tuple[str, str]] = None):
+        """Download a video and upload it to the chat"""
+        user_id = message.from_user.id
+        self._next_task_id += 1
+        task_id = self._next_task_id
+        
+        # Only max_global_downloads downloads run at once; extra tasks wait here.
+        # The progress message doubles as the queue notice meanwhile
+        processing_text = (
+            f"🔍 **Processing Request**\n\n"
+            f"**URL:** [Click Here]({url})\n"
+            f"**Resolution:** {resolution if resolution == 'best' else resolution + 'p'}\n\n"
+            f"🔄 Fetching video information..."
+        )
+        queued = self._download_sem.locked()
+        progress_msg = await message.reply(
+            "⏳ **Queued**\n\n"
+            "All download slots are busy. Your video will start automatically."
+            if queued else processing_text
+        )
+        
+        async with self._download_sem:
+            # Temp directory for this download only; the task ID keeps two
+            # downloads started by a user in the same second apart
+            user_temp_dir = f"{self.config.temp_dir}/user_{user_id}_{int(time.time())}_{task_id}"
+            try:
+                # Track active download
+                self.active_downloads[task_id] = user_id
+                self.download_states[user_id] = {'cancelled': False}
                 
-                # Add cookies if available
-                if self.cookies_available:
-                    ydl_opts['cookiefile'] = self.config['cookies_path']
+                if queued:
+                    await progress_msg.edit_text(processing_text)
+                self._last_edit[(progress_msg.chat.id, progress_msg.id)] = (time.monotonic(), processing_text)
                 
-                # Add proxy if configured
-                if self.config.get('proxy_url'):
-                    ydl_opts['proxy'] = self.config['proxy_url']
+                # Create user-specific temp directory
+                os.makedirs(user_temp_dir, exist_ok=True)
                 
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                # First, extract video info to check if video exists
+                try:
                     # Test video accessibility first
-                    await progress_msg.edit_text(
+                    await self.update_status(
+                        progress_msg,
                         f"🔍 **Checking Video**\n\n"
                         f"**URL:** [Click Here]({url})\n"
                         f"🔄 Verifying video availability..."
                     )
                     
-                    info = ydl.extract_info(url, download=False)
+                    info = await self.get_video_info(url)
                     
                     if not info:
                         await progress_msg.edit_text("❌ **Video Not Found**\n\n"
@@ -1259,15 +1597,15 @@ class YouTubeDownloaderBot:
                         return
                     
                     # Get video title
-                    video_title = info.get('title', 'Unknown Video')
-                    duration = info.get('duration', 0)
+                    video_title = info['title']
+                    duration = info['duration']
                     
                     # Check duration limit
-                    if duration > self.config['max_duration']:
+                    if duration > self.config.max_duration:
                         await progress_msg.edit_text(
                             f"❌ **Video Too Long**\n\n"
                             f"**Duration:** {duration//60}:{duration%60:02d} minutes\n"
-                            f"**Limit:** {self.config['max_duration']//60} minutes\n\n"
+                            f"**Limit:** {self.config.max_duration//60} minutes\n\n"
                             "The video exceeds the maximum allowed duration."
                         )
                         return
@@ -1281,166 +1619,265 @@ class YouTubeDownloaderBot:
                         f"⏬ Starting download..."
                     )
                     
-            except yt_dlp.utils.DownloadError as e:
-                error_msg = str(e).lower()
-                if 'video unavailable' in error_msg or 'private video' in error_msg:
-                    await progress_msg.edit_text("❌ **Video Unavailable**\n\n"
-                                               "This video is private, removed, or unavailable in your region.")
-                elif 'sign in' in error_msg or 'age verification' in error_msg:
-                    await progress_msg.edit_text("🔒 **Age Verification Required**\n\n"
-                                               "This video requires age verification.\n"
-                                               f"**Cookies:** {'✅ Active' if self.cookies_available else '❌ Not configured'}")
-                else:
-                    await progress_msg.edit_text(f"❌ **Download Error**\n\n"
-                                               f"Could not access video:\n"
+                except yt_dlp.utils.DownloadError as e:
+                    error_text = str(e)
+                    match = _YTDL_ERROR_RE.search(error_text)
+                    kind = match.lastgroup if match else None
+                    if kind == 'unavailable':
+                        await progress_msg.edit_text("❌ **Video Unavailable**\n\n"
+                                                   "This video is private, removed, or unavailable in your region.")
+                    elif kind == 'auth':
+                        await progress_msg.edit_text("🔒 **Age Verification Required**\n\n"
+                                                   "This video requires age verification.\n"
+                                                   f"**Cookies:** {'✅ Active' if self.cookies_available else '❌ Not configured'}")
+                    else:
+                        await progress_msg.edit_text(f"❌ **Download Error**\n\n"
+                                                   f"Could not access video:\n"
+                                                   f"`{error_text[:200]}`")
+                    return
+                except Exception as e:
+                    await progress_msg.edit_text(f"❌ **Unexpected Error**\n\n"
+                                               f"Error fetching video info:\n"
                                                f"`{str(e)[:200]}`")
-                return
-            except Exception as e:
-                await progress_msg.edit_text(f"❌ **Unexpected Error**\n\n"
-                                           f"Error fetching video info:\n"
-                                           f"`{str(e)[:200]}`")
-                return
-            
-            # Build yt-dlp format based on resolution
-            if resolution == "best":
-                ytf = "bv*+ba/b"
-            else:
-                ytf = f"bv*[height<={resolution}][ext=mp4]+ba[ext=m4a]/b[height<=?{resolution}]"
-            
-            # Create filename
-            name = self.sanitize_filename(video_title)
-            
-            # Build download command
-            cmd_parts = [
-                'yt-dlp',
-                '--no-warnings',
-                '-R', str(self.config['max_retries']),
-                '--fragment-retries', str(self.config['fragment_retries']),
-                '--no-part',
-                '-f', f'"{ytf}"',
-                '--merge-output-format', 'mp4',
-                '--output', f'"{user_temp_dir}/{name}.%(ext)s"',
-                '--progress', '--newline',
-                '--console-title',
-                '--compat-options', 'no-keep-subs',
-            ]
-            
-            # Add cookies if available
-            if self.cookies_available:
-                cmd_parts.extend(['--cookies', self.config['cookies_path']])
-            
-            # Add proxy if configured
-            if self.config.get('proxy_url'):
-                cmd_parts.extend(['--proxy', self.config['proxy_url']])
-            
-            # Add URL
-            cmd_parts.append(f'"{url}"')
-            
-            cmd = ' '.join(cmd_parts)
-            
-            # Execute download
-            try:
-                await progress_msg.edit_text(
-                    f"⏬ **Downloading Video**\n\n"
-                    f"**Title:** {video_title[:100]}\n"
-                    f"**Resolution:** {resolution if resolution == 'best' else resolution + 'p'}\n\n"
-                    f"🔄 This may take a few minutes...\n\n"
-                    f"**Send /stop to cancel**"
-                )
+                    return
                 
-                process = await asyncio.create_subprocess_shell(
-                    cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
-                    shell=True
-                )
+                # Build yt-dlp format based on resolution. Only video-only
+                # streams are merged with audio; formats that already carry
+                # audio are taken as-is by the fallback, with no ffmpeg pass
+                if resolution == "best":
+                    ytf = "bv+ba/b"
+                else:
+                    ytf = (f"bv[height<={resolution}][ext=mp4]+ba[ext=m4a]"
+                           f"/bv[height<={resolution}]+ba"
+                           f"/b[height<=?{resolution}]/b")
                 
-                # Monitor process output for progress
-                output_lines = []
-                while True:
-                    if self.download_states.get(user_id, {}).get('cancelled'):
-                        process.terminate()
-                        await progress_msg.edit_text("⏹️ Download cancelled. Cleaning up...")
-                        break
-                    
+                # Create filename
+                name = self.sanitize_filename(video_title)
+                
+                # Build download command
+                cmd_parts = [
+                    'yt-dlp',
+                    '--no-warnings',
+                    '-R', str(self.config.max_retries),
+                    '--fragment-retries', str(self.config.fragment_retries),
+                    '--retry-sleep', 'exp=1:30',
+                    '--retry-sleep', 'fragment:exp=1:30',
+                    # Fetch HLS/DASH fragments in parallel and large
+                    # non-fragmented files in 10MB ranges
+                    '-N', str(self.config.concurrent_fragments),
+                    '--http-chunk-size', '10M',
+                    '--no-part',
+                    '-f', f'"{ytf}"',
+                    '--merge-output-format', 'mp4',
+                    '--output', f'"{user_temp_dir}/{name}.%(ext)s"',
+                    '--progress', '--newline',
+                    # Report the final (merged) file so we needn't search for it
+                    '--print', 'after_move:filepath',
+                    '--console-title',
+                    '--compat-options', 'no-keep-subs',
+                ]
+                
+                # Add cookies if available. yt-dlp writes its cookie jar back
+                # into the --cookies file when it exits, so give it a private
+                # copy; the canonical file then only changes on upload or an
+                # external edit
+                if self.cookies_available:
+                    cookies_copy = os.path.join(user_temp_dir, '.cookies.txt')
                     try:
-                        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=0.5)
-                        
-                        # Check if process completed
-                        if process.returncode is not None:
-                            break
-                            
-                    except asyncio.TimeoutError:
-                        # Process still running
-                        continue
+                        await asyncio.to_thread(shutil.copyfile, self.config.cookies_path, cookies_copy)
+                        cmd_parts.extend(['--cookies', cookies_copy])
+                    except OSError as e:
+                        logger.warning(f"Could not copy cookies for download: {e}")
                 
-                if self.download_states.get(user_id, {}).get('cancelled'):
-                    # Cleanup
-                    shutil.rmtree(user_temp_dir, ignore_errors=True)
-                    return
+                # Add proxy if configured
+                if self.config.proxy_url:
+                    cmd_parts.extend(['--proxy', self.config.proxy_url])
+                
+                # Add URL
+                cmd_parts.append(f'"{url}"')
                 
-                # Check if download was successful
-                output_files = list(Path(user_temp_dir).glob('*.mp4'))
-                if not output_files:
-                    output_files = list(Path(user_temp_dir).glob('*.*'))
+                cmd = ' '.join(cmd_parts)
                 
-                if not output_files:
-                    # Try to get error from stderr
-                    error_output = ""
+                # Execute download
+                try:
+                    await self.update_status(
+                        progress_msg,
+                        f"⏬ **Downloading Video**\n\n"
+                        f"**Title:** {video_title[:100]}\n"
+                        f"**Resolution:** {resolution if resolution == 'best' else resolution + 'p'}\n\n"
+                        f"🔄 This may take a few minutes...\n\n"
+                        f"**Send /stop to cancel**",
+                        min_interval=0
+                    )
+                    
+                    process = await asyncio.create_subprocess_shell(
+                        cmd,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE,
+                        shell=True
+                    )
+                    
+                    # Collect the output in one task and poll it for /stop; restarting
+                    # communicate() on every timeout would drop what was read so far
+                    communicate = asyncio.ensure_future(process.communicate())
+                    stdout = stderr = b''
+                    while True:
+                        if self.download_states.get(user_id, {}).get('cancelled'):
+                            process.terminate()
+                            communicate.cancel()
+                            await progress_msg.edit_text("⏹️ Download cancelled. Cleaning up...")
+                            break
+                        
+                        done, _ = await asyncio.wait({communicate}, timeout=0.5)
+                        if done:
+                            stdout, stderr = communicate.result()
+                            break
+                    
+                    if self.download_states.get(user_id, {}).get('cancelled'):
+                        # Cleanup
+                        await asyncio.to_thread(shutil.rmtree, user_temp_dir, ignore_errors=True)
+                        return
+                    
+                    # Check if download was successful
+                    video_path = (self.printed_filepath(stdout, user_temp_dir)
+                                  or self.find_downloaded_video(user_temp_dir))
+                    
+                    if not video_path:
+                        # Try to get error from stderr
+                        error_output = ""
+                        try:
+                            if stderr:
+                                error_output = stderr.decode('utf-8', errors='ignore')[:500]
+                        except:
+                            pass
+                        
+                        await progress_msg.edit_text(
+                            f"❌ **Download Failed**\n\n"
+                            f"No video file was created.\n\n"
+                            f"**Possible issues:**\n"
+                            f"• Video format not supported\n"
+                            f"• Network error\n"
+                            f"• YouTube restrictions\n\n"
+                            f"**Error:** `{error_output[:200] if error_output else 'Unknown error'}`"
+                        )
+                        return
+                    
+                    # Upload to Telegram
+                    sent = await self.upload_video_to_telegram(message, progress_msg, video_path, video_title, resolution, url, user_temp_dir,
+                                                               duration=duration)
+                    if sent and video_key:
+                        self._sent_videos[video_key] = (sent.chat.id, sent.id)
+                    
+                    # Free the disk space now rather than when the cleanup
+                    # worker gets to this directory after the slot is released
                     try:
-                        if stderr:
-                            error_output = stderr.decode('utf-8', errors='ignore')[:500]
-                    except:
+                        await asyncio.to_thread(os.remove, video_path)
+                    except OSError:
                         pass
                     
-                    await progress_msg.edit_text(
-                        f"❌ **Download Failed**\n\n"
-                        f"No video file was created.\n\n"
-                        f"**Possible issues:**\n"
-                        f"• Video format not supported\n"
-                        f"• Network error\n"
-                        f"• YouTube restrictions\n\n"
-                        f"**Error:** `{error_output[:200] if error_output else 'Unknown error'}`"
-                    )
-                    return
-                
-                video_path = str(output_files[0])
-                
-                # Upload to Telegram
-                await self.upload_video_to_telegram(message, progress_msg, video_path, video_title, resolution, url, user_temp_dir)
+                except Exception as e:
+                    logger.error(f"Download error: {e}", exc_info=True)
+                    await progress_msg.edit_text(f"❌ **Download Error**\n\n"
+                                               f"An error occurred during download:\n"
+                                               f"`{str(e)[:200]}`")
                 
             except Exception as e:
-                logger.error(f"Download error: {e}", exc_info=True)
-                await progress_msg.edit_text(f"❌ **Download Error**\n\n"
-                                           f"An error occurred during download:\n"
-                                           f"`{str(e)[:200]}`")
-            
-        except Exception as e:
-            logger.error(f"Error in process_video: {e}", exc_info=True)
-            await message.reply(f"❌ **Processing Failed**\n\n"
-                              f"An unexpected error occurred:\n"
-                              f"`{str(e)[:200]}`")
+                logger.error(f"Error in process_video: {e}", exc_info=True)
+                await message.reply(f"❌ **Processing Failed**\n\n"
+                                  f"An unexpected error occurred:\n"
+                                  f"`{str(e)[:200]}`")
+            
+            finally:
+                # Cleanup
+                self.active_downloads.pop(task_id, None)
+                if user_id in self.download_states:
+                    del self.download_states[user_id]
+                self._last_edit.pop((progress_msg.chat.id, progress_msg.id), None)
+                await self.cleanup_temp_dir(user_temp_dir)
+    
+    async def update_status(self, message: Message, text: str, min_interval: float = 2.0) -> bool:
+        """Edit a progress message unless the text is unchanged or the last edit was too recent
         
-        finally:
-            # Cleanup
-            if task_id in self.active_downloads:
-                del self.active_downloads[task_id]
-            if user_id in self.download_states:
-                del self.download_states[user_id]
-            await self.cleanup_user_files(user_id)
+        Intermediate status updates go through here so back-to-back edits
+        don't run into Telegram's flood limits; final results and errors
+        are still edited directly. A failed edit is logged and skipped so
+        it can't abort the download or upload it is reporting on.
+        """
+        key = (message.chat.id, message.id)
+        now = time.monotonic()
+        last_time, last_text = self._last_edit.get(key, (0.0, None))
+        if text == last_text or now - last_time < min_interval:
+            return False
+        self._last_edit[key] = (now, text)
+        try:
+            await self.telegram_send(lambda: message.edit_text(text), retries=0)
+        except RPCError as e:
+            logger.debug("Status edit skipped: %s", e)
+            return False
+        return True
+    
+    async def telegram_send(self, send: Callable[[], Awaitable[Any]], retries: int = 2) -> Any:
+        """Run a Telegram call, holding back every send while a FloodWait is in effect
+        
+        A FloodWait on any call pauses all calls made through here until it
+        expires, so concurrent uploads back off together instead of each
+        hitting the limit and retrying on their own schedule.
+        """
+        for attempt in range(retries + 1):
+            delay = self._flood_until - time.monotonic()
+            if delay > 0:
+                # Jitter so waiting sends don't all resume at once
+                await asyncio.sleep(delay + random.random())
+            try:
+                return await send()
+            except FloodWait as e:
+                self._flood_until = max(self._flood_until, time.monotonic() + e.value + 1)
+                logger.warning("FloodWait of %ss, pausing sends", e.value)
+                if attempt == retries:
+                    raise
+    
+    def printed_filepath(self, stdout: bytes, directory: str) -> Optional[str]:
+        """Get the final file path yt-dlp printed, if it lies inside directory"""
+        prefix = directory + '/'
+        for line in reversed(stdout.decode('utf-8', errors='ignore').splitlines()):
+            line = line.strip()
+            if line.startswith(prefix):
+                return line
+        return None
+    
+    def find_downloaded_video(self, directory: str) -> Optional[str]:
+        """Find the downloaded video in a directory, preferring MP4"""
+        fallback = None
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                # Dotfiles are ours (the cookies copy), never the download
+                if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                    continue
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext == '.mp4':
+                    return entry.path
+                if ext in _VIDEO_EXTS or (ext and fallback is None):
+                    fallback = entry.path
+        return fallback
     
     async def upload_video_to_telegram(self, original_message: Message, progress_msg: Message, 
                                       video_path: str, video_title: str, resolution: str,
-                                      url: str, temp_dir: str):
-        """Upload video to Telegram with proper error handling"""
+                                      url: str, temp_dir: str, duration: Optional[int] = None) -> Optional[Message]:
+        """Upload video to Telegram with proper error handling, returning the sent message"""
         try:
-            # Get video info
-            probe = ffmpeg.probe(video_path)
-            duration = int(float(probe['format']['duration']))
+            # Generate thumbnail in the background while the file is checked,
+            # the caption prepared and the status edited
+            thumb_task = asyncio.create_task(self.generate_thumbnail(video_path, duration=duration or None))
+            
+            # Get video info, reusing the duration yt-dlp already reported
+            if not duration:
+                probe = await self.probe_video(video_path)
+                duration = float(probe['format']['duration'])
+            duration = int(duration)
             file_size = os.path.getsize(video_path)
             
             # Check file size limit
-            max_size = self.config['max_file_size']
+            max_size = self.config.max_file_size
             if file_size > max_size:
                 await progress_msg.edit_text(
                     f"❌ **File Too Large**\n\n"
@@ -1450,9 +1887,6 @@ class YouTubeDownloaderBot:
                 )
                 return
             
-            # Generate thumbnail
-            thumbnail_path = await self.generate_thumbnail(video_path)
-            
             # Prepare caption
             caption = f"**{video_title[:200]}**\n\n"
             caption += f"📏 **Resolution:** {resolution if resolution == 'best' else resolution + 'p'}\n"
@@ -1460,43 +1894,34 @@ class YouTubeDownloaderBot:
             caption += f"📊 **Size:** {file_size//(1024*1024)}MB\n"
             caption += f"🔗 **Source:** [YouTube]({url})"
             
-            await progress_msg.edit_text("📤 Uploading to Telegram...")
+            await self.update_status(progress_msg, "📤 Uploading to Telegram...")
+            
+            thumbnail_path = await thumb_task
             
             # Send video
             try:
-                await self.app.send_video(
+                sent = await self.telegram_send(lambda: self.app.send_video(
                     chat_id=original_message.chat.id,
                     video=video_path,
                     caption=caption,
                     duration=duration,
                     thumb=thumbnail_path,
                     supports_streaming=True
-                )
-                await progress_msg.edit_text("✅ **Video Sent Successfully!**")
-                
-            except FloodWait as e:
-                await asyncio.sleep(e.value + 1)
-                # Retry
-                await self.app.send_video(
-                    chat_id=original_message.chat.id,
-                    video=video_path,
-                    caption=caption,
-                    duration=duration,
-                    thumb=thumbnail_path,
-                    supports_streaming=True
-                )
+                ))
                 await progress_msg.edit_text("✅ **Video Sent Successfully!**")
+                return sent
                 
             except RPCError as e:
                 logger.error(f"RPCError: {e}")
                 # Fallback to document
-                await self.app.send_document(
+                sent = await self.telegram_send(lambda: self.app.send_document(
                     chat_id=original_message.chat.id,
                     document=video_path,
                     caption=caption,
                     thumb=thumbnail_path
-                )
+                ))
                 await progress_msg.edit_text("✅ **Video sent as document!**")
+                return sent
                 
         except Exception as e:
             logger.error(f"Upload error: {e}", exc_info=True)
@@ -1505,68 +1930,188 @@ class YouTubeDownloaderBot:
                                        f"`{str(e)[:200]}`")
         
         finally:
+            # Don't leave the thumbnail task running if we bailed out early
+            if 'thumb_task' in locals() and not thumb_task.done():
+                thumb_task.cancel()
+            
             # Cleanup thumbnail
-            if 'thumbnail_path' in locals() and thumbnail_path and os.path.exists(thumbnail_path):
+            if 'thumbnail_path' in locals() and thumbnail_path:
                 try:
                     os.remove(thumbnail_path)
-                except:
+                except OSError:
                     pass
     
+    def get_info_ydl(self) -> yt_dlp.YoutubeDL:
+        """Get this worker thread's YoutubeDL instance for info extraction
+        
+        extract_video_info runs in executor threads, so each thread keeps its own
+        instance and rebuilds it only after the cookies change.
+        """
+        key = (self._ydl_generation, self.cookies_available)
+        local = self._ydl_local
+        if getattr(local, 'key', None) != key:
+            local.ydl = yt_dlp.YoutubeDL(self._info_opts_cookies if key[1] else self._info_opts)
+            local.key = key
+        return local.ydl
+    
+    async def get_video_info(self, url: str) -> Optional[Dict[str, Any]]:
+        """Extract the title and duration of a video, cached per video ID
+        
+        The cache is only touched here on the event loop; TTLCache isn't
+        thread-safe, so just the extraction runs in a worker thread.
+        """
+        video_id = None
+        if self.config.cache_video_info:
+            match = _YT_VIDEO_ID_RE.search(url)
+            video_id = match.group(1) if match else None
+            cached = self._info_cache.get(video_id) if video_id else None
+            if cached:
+                return cached
+        
+        video_info = await asyncio.to_thread(self.extract_video_info, url)
+        
+        if video_info and video_id:
+            self._info_cache[video_id] = video_info
+        return video_info
+    
+    def extract_video_info(self, url: str) -> Optional[Dict[str, Any]]:
+        """Run yt-dlp info extraction; called in a worker thread"""
+        info = self.get_info_ydl().extract_info(url, download=False)
+        
+        if not info:
+            return None
+        
+        # Only keep what the pipeline uses; full info dicts are large
+        return {
+            'title': info.get('title') or 'Unknown Video',
+            'duration': info.get('duration') or 0,
+        }
+    
     def sanitize_filename(self, filename: str) -> str:
         """Sanitize filename for safe filesystem usage"""
-        # Remove invalid characters
-        filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-        # Remove emojis and special characters
-        filename = re.sub(r'[^\w\s-]', '', filename)
+        # Remove invalid characters, emojis and special characters
+        filename = _FILENAME_STRIP_RE.sub('', filename)
         # Replace multiple spaces with single space
-        filename = re.sub(r'\s+', ' ', filename)
+        filename = _WHITESPACE_RE.sub(' ', filename)
         # Limit length
         filename = filename[:100]
         return filename.strip()
     
-    async def generate_thumbnail(self, video_path: str) -> Optional[str]:
+    async def run_ffmpeg_tool(self, *args: str) -> bytes:
+        """Run ffmpeg/ffprobe as an async subprocess and return its stdout"""
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"{args[0]} exited with code {process.returncode}: "
+                f"{stderr.decode('utf-8', errors='ignore').strip()[:200]}"
+            )
+        return stdout
+    
+    async def probe_video(self, video_path: str) -> Dict[str, Any]:
+        """Run ffprobe on a file, at most once per path"""
+        task = self._probe_cache.get(video_path)
+        if task is None:
+            task = asyncio.ensure_future(self.run_ffmpeg_tool(
+                'ffprobe', '-v', 'error', '-of', 'json',
+                '-show_format', '-show_streams', video_path
+            ))
+            self._probe_cache[video_path] = task
+        try:
+            return orjson.loads(await asyncio.shield(task))
+        except Exception:
+            self._probe_cache.pop(video_path, None)
+            raise
+    
+    async def generate_thumbnail(self, video_path: str, duration: Optional[float] = None) -> Optional[str]:
         """Generate thumbnail from video"""
         thumbnail_path = video_path + "_thumb.jpg"
         
         try:
-            logger.info(f"Generating thumbnail for {video_path}")
+            logger.info("Generating thumbnail for %s", video_path)
             
             # Extract frame at 10 seconds or 1/4 of duration
-            probe = ffmpeg.probe(video_path)
-            duration = float(probe['format']['duration'])
+            if duration is None:
+                probe = await self.probe_video(video_path)
+                duration = float(probe['format']['duration'])
             frame_time = min(10, duration / 4)
             
-            # Use qscale_v instead of qscale:v
-            ffmpeg.input(video_path, ss=frame_time)\
-                  .output(thumbnail_path, vframes=1, qscale_v=2)\
-                  .run(quiet=True, overwrite_output=True, capture_stdout=True, capture_stderr=True)
+            # Fast-seek to the nearest keyframe before the input and grab a
+            # single frame; a thumbnail doesn't need the exact timestamp
+            await self.run_ffmpeg_tool(
+                'ffmpeg', '-y', '-loglevel', 'error',
+                '-threads', self._ffmpeg_threads,
+                '-noaccurate_seek', '-ss', str(frame_time), '-i', video_path,
+                '-an', '-sn', '-vframes', '1',
+                # Telegram only shows thumbnails up to 320px on the long side
+                '-vf', 'scale=320:320:force_original_aspect_ratio=decrease',
+                '-q:v', '2', thumbnail_path
+            )
             
-            if os.path.exists(thumbnail_path) and os.path.getsize(thumbnail_path) > 0:
-                return thumbnail_path
-            else:
-                logger.warning("Thumbnail generation failed")
+            try:
+                if os.stat(thumbnail_path).st_size > 0:
+                    return thumbnail_path
+            except FileNotFoundError:
+                pass
+            logger.warning("Thumbnail generation failed")
                 
         except Exception as e:
             logger.error(f"Error generating thumbnail: {e}")
         
         return None
     
-    async def cleanup_user_files(self, user_id: int):
-        """Clean up user's temporary files"""
-        # Find all user directories
-        temp_dir = self.config['temp_dir']
-        for item in os.listdir(temp_dir):
-            if item.startswith(f"user_{user_id}_"):
-                user_dir = os.path.join(temp_dir, item)
-                if os.path.exists(user_dir):
-                    try:
-                        shutil.rmtree(user_dir)
-                        logger.info(f"Cleaned up temp files: {user_dir}")
-                    except Exception as e:
-                        logger.error(f"Error cleaning user files: {e}")
+    async def cleanup_temp_dir(self, temp_dir: str):
+        """Clean up one download's temporary files
+        
+        The directory is removed by cleanup_worker so the caller isn't
+        held up by disk IO. Only this exact directory is removed, so a
+        newer download by the same user is left alone.
+        """
+        # Forget probe results for files about to be removed
+        prefix = temp_dir + '/'
+        for path in [p for p in self._probe_cache if p.startswith(prefix)]:
+            del self._probe_cache[path]
+        
+        if self._cleanup_queue is None:
+            await asyncio.to_thread(self.remove_temp_dir, temp_dir)
+        else:
+            self._cleanup_queue.put_nowait(temp_dir)
+    
+    def remove_temp_dir(self, temp_dir: str):
+        """Remove a download's temp directory"""
+        try:
+            shutil.rmtree(temp_dir)
+            logger.info("Cleaned up temp files: %s", temp_dir)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error cleaning user files: {e}")
+    
+    async def cleanup_worker(self):
+        """Remove queued temp directories in a worker thread"""
+        while True:
+            temp_dir = await self._cleanup_queue.get()
+            try:
+                await asyncio.to_thread(self.remove_temp_dir, temp_dir)
+            except Exception as e:
+                logger.error(f"Error cleaning user files: {e}")
+            finally:
+                self._cleanup_queue.task_done()
     
     async def run(self):
         """Main entry point - runs both web server and Telegram bot"""
+        # Temp directories are removed and system metrics sampled in the background
+        self._cleanup_queue = asyncio.Queue()
+        background_tasks = [
+            asyncio.create_task(self.cleanup_worker()),
+            asyncio.create_task(self.system_metrics_sampler()),
+        ]
+        
         try:
             # Start web server first (for Render health checks)
             logger.info("Starting web server...")
@@ -1575,31 +2120,88 @@ class YouTubeDownloaderBot:
             # Start Telegram bot
             logger.info("Starting Telegram bot...")
             me = await self.start_client()
+            self.start_cookies_watcher()
             
             # Keep both running
-            logger.info(f"✅ Bot is running! Telegram: @{me.username}, Web: http://0.0.0.0:{self.config['port']}")
+            logger.info(f"✅ Bot is running! Telegram: @{me.username}, Web: http://0.0.0.0:{self.config.port}")
             logger.info("Press Ctrl+C to stop.")
             
-            # Run forever
-            await idle()
+            # Run until SIGINT/SIGTERM
+            self._stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            try:
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    loop.add_signal_handler(sig, self._stop_event.set)
+            except NotImplementedError:
+                # Signal handlers are unavailable on this platform
+                await idle()
+            else:
+                await self._stop_event.wait()
             
         except KeyboardInterrupt:
             logger.info("Shutting down gracefully...")
         except Exception as e:
             logger.error(f"Fatal error: {e}", exc_info=True)
         finally:
-            # Cleanup web server
-            if self.runner:
-                await self.runner.cleanup()
-                logger.info("Web server stopped")
-            
-            # Cleanup Telegram client
-            if self.app:
-                try:
-                    await self.app.stop()
-                    logger.info("Telegram bot stopped")
-                except:
-                    pass
+            # Stop web server and Telegram client in parallel
+            await asyncio.gather(
+                self.stop_web_server(),
+                self.stop_client(),
+                return_exceptions=True
+            )
+            for task in background_tasks:
+                task.cancel()
+            self.stop_cookies_watcher()
+    
+    def start_cookies_watcher(self):
+        """Watch the cookies file so its metadata refreshes without polling"""
+        if Observer is None:
+            logger.info("watchdog not installed; cookies metadata refreshes on upload or /cookies_refresh only")
+            return
+        
+        try:
+            observer = Observer()
+            observer.schedule(
+                CookiesFileHandler(self, asyncio.get_running_loop()),
+                os.path.dirname(os.path.abspath(self.config.cookies_path)),
+                recursive=False
+            )
+            observer.daemon = True
+            observer.start()
+            self._cookies_observer = observer
+        except Exception as e:
+            logger.warning(f"Could not watch cookies file: {e}")
+    
+    def stop_cookies_watcher(self):
+        """Stop the cookies file observer"""
+        if self._cookies_observer is not None:
+            self._cookies_observer.stop()
+            self._cookies_observer = None
+    
+    async def stop_web_server(self):
+        """Stop the health check web server and its thread"""
+        if self._web_loop is None:
+            return
+        
+        if self.runner:
+            await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self._web_loop)
+            )
+            logger.info("Web server stopped")
+        
+        self._web_loop.call_soon_threadsafe(self._web_loop.stop)
+        await asyncio.to_thread(self._web_thread.join)
+        self._web_loop.close()
+        self._web_loop = None
+    
+    async def stop_client(self):
+        """Stop the Telegram client"""
+        if self.app:
+            try:
+                await self.app.stop()
+                logger.info("Telegram bot stopped")
+            except:
+                pass
 
 
 async def main():
@@ -1629,6 +2231,13 @@ async def main():
 
 
 if __name__ == "__main__":
+    # Use uvloop's faster event loop when it's installed
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     # Run with asyncio
     try:
         asyncio.run(main())